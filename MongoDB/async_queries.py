@@ -0,0 +1,102 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from MongoDB import queries
+from MongoDB.instrumentation import profiler
+
+# pymongo es sincrono: las queries corren en un pool acotado de threads para no
+# bloquear el event loop. El tamaño no debe pasar el maxPoolSize del MongoClient.
+MAX_WORKERS = int(os.getenv('MONGO_EXECUTOR_WORKERS', '32'))
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='mongo-query')
+
+    return _executor
+
+
+def shutdown_executor(wait=True):
+    global _executor
+
+    if _executor:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+
+def _forget_executor_after_fork():
+    # Los threads del executor no existen en el proceso hijo
+    global _executor
+    _executor = None
+
+os.register_at_fork(after_in_child=_forget_executor_after_fork)
+
+
+def run_query(func, *args, **kwargs):
+    """Ejecuta una query sincrona en el executor y regresa un awaitable."""
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def _awaitable(func):
+    # El profiler mide dentro del thread del executor, sin contar la espera por un thread libre
+    instrumented = profiler.instrument(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_query(instrumented, *args, **kwargs)
+    return wrapper
+
+
+#User queries
+get_user_by_id = _awaitable(queries.get_user_by_id)
+get_user_by_username = _awaitable(queries.get_user_by_username)
+get_users_by_location = _awaitable(queries.get_users_by_location)
+get_user_cards_by_ids = _awaitable(queries.get_user_cards_by_ids)
+get_user_cards_by_usernames = _awaitable(queries.get_user_cards_by_usernames)
+create_user = _awaitable(queries.create_user)
+update_user = _awaitable(queries.update_user)
+get_user_privacy_settings = _awaitable(queries.get_user_privacy_settings)
+update_privacy_settings = _awaitable(queries.update_privacy_settings)
+get_notification_preferences = _awaitable(queries.get_notification_preferences)
+update_notification_preferences = _awaitable(queries.update_notification_preferences)
+
+#Post queries
+get_posts_by_date_range = _awaitable(queries.get_posts_by_date_range)
+get_viral_posts = _awaitable(queries.get_viral_posts)
+create_post = _awaitable(queries.create_post)
+increment_post_counters = _awaitable(queries.increment_post_counters)
+
+# user_relationships queries
+get_user_following = _awaitable(queries.get_user_following)
+follow_user = _awaitable(queries.follow_user)
+unfollow_user = _awaitable(queries.unfollow_user)
+
+#searched_history queries
+get_search_history = _awaitable(queries.get_search_history)
+add_to_search_history = _awaitable(queries.add_to_search_history)
+
+#best_friends queries
+get_best_friends = _awaitable(queries.get_best_friends)
+add_best_friend = _awaitable(queries.add_best_friend)
+remove_best_friend = _awaitable(queries.remove_best_friend)
+bulk_add_best_friends = _awaitable(queries.bulk_add_best_friends)
+bulk_remove_best_friends = _awaitable(queries.bulk_remove_best_friends)
+
+#saved_post queries
+get_saved_posts = _awaitable(queries.get_saved_posts)
+save_post = _awaitable(queries.save_post)
+unsave_post = _awaitable(queries.unsave_post)
+bulk_save_posts = _awaitable(queries.bulk_save_posts)
+bulk_unsave_posts = _awaitable(queries.bulk_unsave_posts)
+
+#pipeline summary
+get_profile_summary = _awaitable(queries.get_profile_summary)
@@ -0,0 +1,147 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_WRITERS = 4
+
+CHECKPOINT_COLLECTION = 'load_checkpoints'
+# Parametros que definen los datos generados; si cambian no se puede reanudar
+CHECKPOINT_KEYS = ('mode', 'users', 'seed', 'profile', 'posts_per_user', 'chunk_users')
+
+
+def insert_batch(collection, batch):
+    """insert_many sin orden; los _id repetidos (al reanudar un lote ya escrito) no son error."""
+    try:
+        return len(collection.insert_many(batch, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        if any(error['code'] != 11000 for error in e.details.get('writeErrors', [])):
+            raise
+        return e.details['nInserted']
+
+
+def batched(documents, size):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BulkLoader:
+    """Escribe documentos en lotes sin orden desde varios threads escritores.
+
+    Mientras los escritores esperan a MongoDB el thread que llama sigue generando el
+    siguiente lote. Como maximo hay 2 lotes por escritor en memoria.
+    """
+
+    def __init__(self, db, batch_size=DEFAULT_BATCH_SIZE, writers=DEFAULT_WRITERS):
+        self.db = db
+        self.batch_size = batch_size
+        self.writers = writers
+
+    def reset_collections(self, collection_names):
+        # drop + create es mas rapido que delete_many y deja la coleccion sin indices
+        # secundarios; sync_indexes los construye una sola vez al terminar la carga
+        for name in collection_names:
+            self.db.drop_collection(name)
+            self.db.create_collection(name)
+
+    def write(self, collection_name, documents):
+        """Regresa (insertados, inicio, fin) con tiempos de time.time()."""
+        collection = self.db[collection_name]
+        started = time.time()
+        inserted = 0
+        pending = set()
+
+        with ThreadPoolExecutor(max_workers=self.writers, thread_name_prefix='bulk-writer') as executor:
+            for batch in batched(documents, self.batch_size):
+                if len(pending) >= self.writers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    inserted += sum(future.result() for future in done)
+                pending.add(executor.submit(insert_batch, collection, batch))
+
+            inserted += sum(future.result() for future in pending)
+
+        return inserted, started, time.time()
+
+
+class Checkpoint:
+    """Tareas terminadas de una carga, guardadas en MongoDB para poder reanudarla."""
+
+    def __init__(self, db, config):
+        self.collection = db[CHECKPOINT_COLLECTION]
+        self.config = {key: config.get(key) for key in CHECKPOINT_KEYS}
+        self.now = None
+
+    def start(self, resume=False):
+        """Regresa las llaves de las tareas ya terminadas (vacio si es una carga nueva).
+
+        Deja en self.now el reloj de la corrida: las fechas generadas se calculan hacia atras
+        desde ahi. Al reanudar se usa el de la corrida original para generar los mismos datos.
+        """
+        run = self.collection.find_one({'_id': 'run'})
+
+        if resume:
+            if run is None or run.get('status') == 'complete':
+                raise RuntimeError('There is no interrupted load to resume')
+            stored = {key: run['config'].get(key) for key in CHECKPOINT_KEYS}
+            if stored != self.config:
+                raise RuntimeError(f"Interrupted load used different settings: {stored}")
+            self.now = run['config'].get('now', run['started_at'])
+            return {task['_id'] for task in self.collection.find({'_id': {'$ne': 'run'}}, {'_id': 1})}
+
+        # MongoDB guarda milisegundos; sin microsegundos el valor guardado es identico
+        self.now = datetime.now().replace(microsecond=0)
+        self.collection.delete_many({})
+        self.collection.insert_one({
+            '_id': 'run', 'config': {**self.config, 'now': self.now}, 'status': 'loading', 'started_at': self.now
+        })
+        return set()
+
+    def mark_done(self, task_key, collection_name, inserted, started, finished):
+        self.collection.replace_one(
+            {'_id': task_key},
+            {
+                'collection': collection_name,
+                'inserted': inserted,
+                'started': started,
+                'finished': finished
+            },
+            upsert=True
+        )
+
+    def completed_tasks(self):
+        return list(self.collection.find({'_id': {'$ne': 'run'}}))
+
+    def finish(self):
+        self.collection.update_one({'_id': 'run'}, {'$set': {'status': 'complete', 'finished_at': datetime.now()}})
+
+
+def throughput_report(tasks):
+    """tasks: (coleccion, insertados, inicio, fin). Docs/s por coleccion sobre su ventana de carga."""
+    report = {}
+    for collection_name, inserted, started, finished in tasks:
+        entry = report.setdefault(collection_name, {'docs': 0, 'started': started, 'finished': finished})
+        entry['docs'] += inserted
+        entry['started'] = min(entry['started'], started)
+        entry['finished'] = max(entry['finished'], finished)
+
+    return {
+        name: {
+            'docs': entry['docs'],
+            'seconds': round(entry['finished'] - entry['started'], 2),
+            'docs_per_second': round(entry['docs'] / max(entry['finished'] - entry['started'], 1e-9))
+        }
+        for name, entry in report.items()
+    }
+
+
+def print_throughput(tasks):
+    for collection_name, stats in throughput_report(tasks).items():
+        print(f"  {collection_name}: {stats['docs']} docs en {stats['seconds']} s ({stats['docs_per_second']} docs/s)")
@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUTTLCache:
+    """Cache LRU con expiracion por entrada, segura para los threads del executor."""
+
+    def __init__(self, max_size=10000, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, count=True):
+        with self._lock:
+            entry = self._data.get(key)
+
+            if entry is None:
+                self.misses += count
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += count
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += count
+            return value
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
+
+
+class UserCache:
+    """Documentos de usuario por _id; el username es un alias hacia el _id."""
+
+    def __init__(self, max_size=10000, ttl=30):
+        self._cache = LRUTTLCache(max_size, ttl)
+
+    def get_by_id(self, user_id):
+        return self._cache.get(('id', str(user_id)))
+
+    def get_by_username(self, username):
+        user = None
+        user_id = self._cache.get(('username', username), count=False)
+        if user_id is not None:
+            user = self._cache.get(('id', user_id), count=False)
+
+        # El alias puede apuntar a un usuario que ya cambio de username
+        if user is not None and user.get('username') != username:
+            user = None
+
+        self._cache.record(user is not None)
+        return user
+
+    def put(self, user):
+        self._cache.set(('id', str(user['_id'])), user)
+        if user.get('username') is not None:
+            self._cache.set(('username', user['username']), str(user['_id']))
+
+    def invalidate(self, user_id):
+        self._cache.delete(('id', str(user_id)))
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
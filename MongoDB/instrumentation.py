@@ -0,0 +1,351 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Documento en app_settings que comparten todos los workers
+SETTINGS_ID = 'query_profiler'
+# Cada worker relee la configuracion como maximo cada tantos segundos
+SETTINGS_REFRESH_SECONDS = float(os.getenv('MONGO_PROFILER_REFRESH_SECONDS', '10'))
+# Un explain por funcion cada tantos segundos, para no duplicar la carga de una query lenta
+EXPLAIN_INTERVAL_SECONDS = float(os.getenv('MONGO_PROFILER_EXPLAIN_INTERVAL_SECONDS', '60'))
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value in (None, ''):
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# Apagado por defecto: se enciende en caliente con PUT /mongo/admin/query-profiler
+DEFAULT_SETTINGS = {
+    'enabled': _env_bool('MONGO_QUERY_PROFILER', False),
+    'slow_ms': float(os.getenv('MONGO_SLOW_QUERY_MS', '100')),
+    'explain': _env_bool('MONGO_SLOW_QUERY_EXPLAIN', False),
+}
+
+# Comandos que aceptan explain (queryPlanner no ejecuta las escrituras)
+EXPLAINABLE_COMMANDS = ('find', 'aggregate', 'count', 'distinct', 'findAndModify', 'update', 'delete')
+
+# Campos del driver que no forman parte de la query
+DRIVER_FIELDS = ('lsid', '$db', '$clusterTime', '$readPreference', 'txnNumber', 'signature', 'readConcern', 'writeConcern')
+
+# Se conservan literales: definen el plan, no son valores del usuario
+LITERAL_KEYS = ('sort', '$sort', 'projection', '$project', 'hint', 'limit', '$limit')
+
+MAX_SHAPE_ITEMS = 20
+
+
+def query_shape(value, key=None):
+    """Reemplaza los valores por su tipo: {'user_id': 'ObjectId', 'created_at': {'$gte': 'datetime'}}."""
+    if key in LITERAL_KEYS:
+        return value
+    if isinstance(value, dict):
+        return {k: query_shape(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Pipelines y $or conservan cada elemento; listas de valores ($in) se reducen a un tipo
+        if value and all(isinstance(item, dict) for item in value):
+            shapes = [query_shape(item) for item in value[:MAX_SHAPE_ITEMS]]
+            return shapes + ['...'] if len(value) > MAX_SHAPE_ITEMS else shapes
+        return [query_shape(value[0])] if value else []
+    return type(value).__name__
+
+
+def command_shape(command_name, command):
+    shape = query_shape(command)
+    # El valor del comando es la coleccion: {'find': 'posts', 'filter': {...}}
+    if command_name in command:
+        shape[command_name] = command[command_name]
+    return shape
+
+
+def count_documents(result):
+    """Documentos que regresa una funcion de queries.py segun la forma de su resultado."""
+    if result is None or isinstance(result, (bool, int, float, str)):
+        return 0
+    if isinstance(result, dict):
+        return 1
+    if isinstance(result, tuple):
+        # (pagina, cursor), (usuarios, faltantes), (resultados, insertados)
+        return count_documents(result[0]) if result else 0
+    if isinstance(result, list):
+        return len(result)
+    return 1
+
+
+def summarize_plan(stage):
+    """'LIMIT > FETCH > IXSCAN user_timeline' a partir de un winningPlan."""
+    parts = []
+    while stage:
+        # En MongoDB 5+ con SBE el plan viene dentro de queryPlan
+        if 'queryPlan' in stage and 'stage' not in stage:
+            stage = stage['queryPlan']
+            continue
+
+        name = stage.get('stage', '?')
+        if stage.get('indexName'):
+            name = f"{name} {stage['indexName']}"
+        parts.append(name)
+
+        if 'inputStage' in stage:
+            stage = stage['inputStage']
+        elif stage.get('inputStages'):
+            parts.append('[' + ' | '.join(summarize_plan(child) for child in stage['inputStages']) + ']')
+            break
+        else:
+            break
+
+    return ' > '.join(parts)
+
+
+def _find_query_planner(explain):
+    # find/update traen queryPlanner arriba; aggregate lo trae dentro de stages[0].$cursor
+    if isinstance(explain, dict):
+        if 'queryPlanner' in explain:
+            return explain['queryPlanner']
+        children = explain.values()
+    elif isinstance(explain, list):
+        children = explain
+    else:
+        return None
+
+    for child in children:
+        planner = _find_query_planner(child)
+        if planner is not None:
+            return planner
+    return None
+
+
+class QueryProfiler:
+    """Tiempo, documentos y forma de cada llamada a una funcion de queries.py, por worker."""
+
+    def __init__(self, settings=None):
+        self.settings = dict(settings or DEFAULT_SETTINGS)
+        self._settings_checked_at = 0.0
+        self._settings_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {}
+        self._last_explained = {}
+        self._explain_executor = None
+
+    # Configuracion
+
+    def refresh_settings(self, db, force=False):
+        now = time.monotonic()
+        if db is None or (not force and now - self._settings_checked_at < SETTINGS_REFRESH_SECONDS):
+            return
+
+        # Solo un thread relee; los demas siguen con la configuracion actual
+        if not self._settings_lock.acquire(blocking=force):
+            return
+        try:
+            self._settings_checked_at = now
+            stored = db.app_settings.find_one({'_id': SETTINGS_ID}) or {}
+            self.settings = {key: stored.get(key, default) for key, default in DEFAULT_SETTINGS.items()}
+        except Exception as e:
+            logger.debug("Could not refresh query profiler settings: %s", e)
+        finally:
+            self._settings_lock.release()
+
+    def update_settings(self, db, changes):
+        """Guarda la configuracion para todos los workers; los demas la ven en su siguiente refresh."""
+        unknown = set(changes) - set(DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+
+        update = {}
+        for key, value in changes.items():
+            if key == 'slow_ms':
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                    raise ValueError('slow_ms must be a non-negative number')
+                update[key] = float(value)
+            else:
+                if not isinstance(value, bool):
+                    raise ValueError(f'{key} must be a boolean')
+                update[key] = value
+
+        db.app_settings.update_one(
+            {'_id': SETTINGS_ID},
+            {'$set': {**update, 'updated_at': datetime.now()}},
+            upsert=True
+        )
+        self.refresh_settings(db, force=True)
+        return dict(self.settings)
+
+    # Captura de comandos
+
+    def capture_command(self, command_name, command):
+        commands = getattr(self._local, 'commands', None)
+        if commands is not None:
+            commands.append((command_name, {k: v for k, v in command.items() if k not in DRIVER_FIELDS}))
+
+    @contextmanager
+    def capture(self):
+        """Junta en una lista los (nombre, comando) que manda este thread dentro del bloque."""
+        previous = getattr(self._local, 'commands', None)
+        commands = self._local.commands = []
+        try:
+            yield commands
+        finally:
+            self._local.commands = previous
+            if previous is not None:
+                previous.extend(commands)
+
+    def instrument(self, func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            db = args[0] if args else kwargs.get('db')
+            self.refresh_settings(db)
+            if not self.settings['enabled']:
+                return func(*args, **kwargs)
+
+            result = None
+            error = None
+            with self.capture() as commands:
+                started = time.perf_counter()
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                elapsed_ms = (time.perf_counter() - started) * 1000
+
+            # Fuera del bloque, para que el explain de una query lenta no se capture
+            self._record(name, db, elapsed_ms, count_documents(result), error is not None, commands)
+            if error is not None:
+                raise error
+            return result
+
+        return wrapper
+
+    # Estadisticas y log de queries lentas
+
+    def _record(self, name, db, elapsed_ms, documents, failed, commands):
+        slow = elapsed_ms >= self.settings['slow_ms']
+        shapes = [(command_name, command_shape(command_name, command)) for command_name, command in commands]
+
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = {
+                    'calls': 0, 'errors': 0, 'slow': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'documents': 0, 'commands': 0, 'last_shape': None
+                }
+            stats['calls'] += 1
+            stats['errors'] += failed
+            stats['slow'] += slow
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['documents'] += documents
+            stats['commands'] += len(commands)
+            if shapes:
+                stats['last_shape'] = shapes
+
+            explain_now = False
+            if slow and self.settings['explain'] and db is not None:
+                now = time.monotonic()
+                if now - self._last_explained.get(name, -EXPLAIN_INTERVAL_SECONDS) >= EXPLAIN_INTERVAL_SECONDS:
+                    self._last_explained[name] = now
+                    explain_now = True
+
+        if not slow:
+            return
+
+        logger.warning(
+            "Slow query %s: %.1f ms, %d documents, %d commands%s %s",
+            name, elapsed_ms, documents, len(commands), ' (failed)' if failed else '',
+            json.dumps(shapes, default=str, separators=(',', ':'))
+        )
+
+        if explain_now:
+            # El explain es otra ida a MongoDB: la request no lo espera
+            self._get_explain_executor().submit(self._log_plans, name, db, commands)
+
+    def _log_plans(self, name, db, commands):
+        for command_name, plan in self.explain(db, commands):
+            logger.warning("Slow query %s: %s winning plan: %s", name, command_name, plan)
+
+    def _get_explain_executor(self):
+        # Un solo thread: los explain se hacen uno a la vez, en el orden en que llegaron
+        with self._lock:
+            if self._explain_executor is None:
+                self._explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='query-explain')
+            return self._explain_executor
+
+    def shutdown_explain(self, wait=True):
+        """Descarta los explain pendientes; con wait espera al que esta corriendo."""
+        with self._lock:
+            executor, self._explain_executor = self._explain_executor, None
+        if executor:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _forget_explain_executor(self):
+        # El thread del executor no existe en el proceso hijo
+        self._explain_executor = None
+
+    def explain(self, db, commands):
+        plans = []
+        for command_name, command in commands:
+            if command_name not in EXPLAINABLE_COMMANDS:
+                continue
+            try:
+                result = db.command({'explain': command, 'verbosity': 'queryPlanner'})
+                planner = _find_query_planner(result)
+                plan = summarize_plan(planner['winningPlan']) if planner else 'no queryPlanner in explain'
+            except Exception as e:
+                plan = f"explain failed: {e}"
+            plans.append((command_name, plan))
+        return plans
+
+    def stats(self):
+        with self._lock:
+            queries = {
+                name: {
+                    **stats,
+                    'total_ms': round(stats['total_ms'], 3),
+                    'max_ms': round(stats['max_ms'], 3),
+                    'avg_ms': round(stats['total_ms'] / stats['calls'], 3) if stats['calls'] else 0
+                }
+                for name, stats in self._stats.items()
+            }
+        # Las que mas tiempo acumulan primero
+        return dict(sorted(queries.items(), key=lambda item: item[1]['total_ms'], reverse=True))
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+            self._last_explained.clear()
+
+
+class QueryCommandListener(monitoring.CommandListener):
+    """Pasa al profiler los comandos que manda el thread que esta ejecutando una query instrumentada."""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def started(self, event):
+        self.profiler.capture_command(event.command_name, event.command)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+profiler = QueryProfiler()
+command_listener = QueryCommandListener(profiler)
+
+os.register_at_fork(after_in_child=profiler._forget_explain_executor)
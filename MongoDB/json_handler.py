@@ -0,0 +1,29 @@
+import json
+from datetime import date, datetime
+
+import falcon
+from bson.decimal128 import Decimal128
+from bson.objectid import ObjectId
+
+
+def bson_default(value):
+    """Convierte los tipos BSON que json no conoce; se llama una vez por valor."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal128):
+        return str(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+# El encoder en C recorre el documento una sola vez y no modifica el original
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=bson_default)
+
+
+def dumps(media):
+    return _encoder.encode(media).encode('utf-8')
+
+
+def create_json_handler():
+    return falcon.media.JSONHandler(dumps=dumps, loads=json.loads)
@@ -0,0 +1,187 @@
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, IndexModel
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from MongoDB import queries
+
+# Unica fuente de verdad de los indices. Cualquier otro indice (salvo _id_) se elimina.
+INDEXES = {
+    'users': [
+        IndexModel([('username', ASCENDING)], unique=True, name='username_unique'),
+        IndexModel([('email', ASCENDING)], unique=True, name='email_unique'),
+        IndexModel([('location_search.full', ASCENDING)], name='location_prefix'),
+        IndexModel([('location_search.tokens', ASCENDING)], name='location_tokens'),
+        IndexModel(
+            [('location_search.city', ASCENDING), ('location_search.state', ASCENDING)],
+            name='location_city_state'
+        ),
+        IndexModel([('location_search.state', ASCENDING)], name='location_state'),
+    ],
+    'posts': [
+        IndexModel(
+            [('user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+            name='user_timeline'
+        ),
+        IndexModel([('hashtags', ASCENDING)], name='hashtags_search'),
+        IndexModel([('location', ASCENDING)], name='location_filter'),
+    ],
+    'viral_leaderboard': [
+        IndexModel([('engagement_score', DESCENDING), ('_id', DESCENDING)], name='engagement_rank'),
+        IndexModel([('user_id', ASCENDING)], name='author_lookup'),
+        IndexModel(
+            [('created_at', ASCENDING)],
+            expireAfterSeconds=queries.VIRAL_WINDOW_DAYS * 86400,
+            name='expire_outside_window'
+        ),
+    ],
+    'user_relationships': [
+        IndexModel([('following_id', ASCENDING)], name='following_lookup'),
+        IndexModel(
+            [('follower_id', ASCENDING), ('following_id', ASCENDING)],
+            unique=True,
+            name='unique_relationship'
+        ),
+        IndexModel(
+            [('follower_id', ASCENDING), ('status', ASCENDING), ('followed_at', DESCENDING), ('_id', DESCENDING)],
+            name='following_timeline'
+        ),
+    ],
+    'best_friends': [
+        IndexModel([('user_id', ASCENDING), ('friend_id', ASCENDING)], unique=True, name='unique_friendship'),
+    ],
+    'saved_posts': [
+        IndexModel([('user_id', ASCENDING), ('saved_at', DESCENDING)], name='show_saved'),
+        IndexModel([('user_id', ASCENDING), ('post_id', ASCENDING)], unique=True, name='unique_saved_post'),
+    ],
+    'search_history': [
+        IndexModel([('updated_at', ASCENDING)], expireAfterSeconds=7776000, name='expire_idle_history'),
+    ],
+}
+
+# Opciones que cambian el comportamiento del indice; el resto (v, ns, background) se ignora
+COMPARED_OPTIONS = ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression')
+
+
+def convert_search_history(db):
+    # Agrupa el historial de un documento por busqueda en un documento por usuario
+    db.search_history.aggregate([
+        {'$match': {'user_id': {'$exists': True}}},
+        {'$sort': {'searched_at': -1}},
+        {
+            '$group': {
+                '_id': '$user_id',
+                'entries': {'$push': {'searched_user_id': '$searched_user_id', 'searched_at': '$searched_at'}},
+                'updated_at': {'$max': '$searched_at'}
+            }
+        },
+        {'$set': {'entries': {'$slice': ['$entries', queries.MAX_SEARCH_HISTORY]}}},
+        {'$merge': {'into': 'search_history', 'on': '_id', 'whenMatched': 'keepExisting', 'whenNotMatched': 'insert'}}
+    ])
+    db.search_history.delete_many({'user_id': {'$exists': True}})
+
+
+# (version, descripcion, funcion). Se aplican en orden las que sean mayores a la version guardada.
+DATA_MIGRATIONS = [
+    (1, 'backfill users.location_search', queries.backfill_location_search),
+    (2, 'convert search_history to one document per user', convert_search_history),
+    (3, 'rebuild viral_leaderboard', queries.rebuild_viral_leaderboard),
+    (4, 'recompute users.stats', queries.recompute_user_stats),
+]
+
+SCHEMA_VERSION = DATA_MIGRATIONS[-1][0]
+
+
+def _normalize_key(key):
+    return [(field, int(direction) if isinstance(direction, (int, float)) else direction) for field, direction in key]
+
+
+def _spec(document):
+    spec = {'key': _normalize_key(document['key'].items() if isinstance(document['key'], dict) else document['key'])}
+    for option in COMPARED_OPTIONS:
+        if option in document:
+            spec[option] = document[option]
+    return spec
+
+
+def plan_indexes(db):
+    """Compara INDEXES contra los indices existentes y regresa (crear, eliminar) por coleccion."""
+    plan = {}
+
+    for collection_name, models in INDEXES.items():
+        existing = {
+            name: _spec(info) for name, info in db[collection_name].index_information().items()
+            if name != '_id_'
+        }
+        desired = {model.document['name']: model for model in models}
+
+        to_drop = []
+        for name, spec in existing.items():
+            model = desired.get(name)
+            if model is None or _spec(model.document) != spec:
+                to_drop.append(name)
+
+        to_create = [
+            model for name, model in desired.items()
+            if name not in existing or name in to_drop
+        ]
+
+        if to_drop or to_create:
+            plan[collection_name] = (to_create, to_drop)
+
+    return plan
+
+
+def sync_indexes(db, dry_run=False, log=print):
+    plan = plan_indexes(db)
+
+    for collection_name, (to_create, to_drop) in plan.items():
+        collection = db[collection_name]
+
+        # Primero se eliminan: MongoDB no deja crear un indice con la misma llave y otro nombre
+        for name in to_drop:
+            log(f"drop   {collection_name}.{name}")
+            if not dry_run:
+                collection.drop_index(name)
+
+        for model in to_create:
+            log(f"create {collection_name}.{model.document['name']}")
+
+        if to_create and not dry_run:
+            collection.create_indexes(to_create)
+
+    if not plan:
+        log("indexes up to date")
+    return plan
+
+
+def get_schema_version(db):
+    state = db.schema_migrations.find_one({'_id': 'schema'})
+    return state['version'] if state else 0
+
+
+def set_schema_version(db, version):
+    db.schema_migrations.update_one(
+        {'_id': 'schema'},
+        {'$set': {'version': version, 'applied_at': datetime.now()}},
+        upsert=True
+    )
+
+
+def migrate(db, dry_run=False, log=print):
+    current = get_schema_version(db)
+    log(f"schema version {current} -> {SCHEMA_VERSION}")
+
+    sync_indexes(db, dry_run=dry_run, log=log)
+
+    for version, description, migration in DATA_MIGRATIONS:
+        if version <= current:
+            continue
+
+        log(f"migration {version}: {description}")
+        if not dry_run:
+            migration(db)
+            set_schema_version(db, version)
+
+    return SCHEMA_VERSION if not dry_run else current
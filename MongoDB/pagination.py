@@ -0,0 +1,50 @@
+import base64
+import json
+from datetime import datetime
+
+from bson.objectid import ObjectId
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def clamp_page_size(limit, default=DEFAULT_PAGE_SIZE):
+    if not limit:
+        return default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(sort_value, doc_id):
+    # Token opaco con la ultima llave (fecha, _id) de la pagina
+    payload = json.dumps([sort_value.isoformat(), str(doc_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        sort_value, doc_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(sort_value), ObjectId(doc_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def keyset_filter(field, token):
+    """Condicion para continuar despues del cursor en un orden (field desc, _id desc)."""
+    sort_value, doc_id = decode_cursor(token)
+    return {
+        '$or': [
+            {field: {'$lt': sort_value}},
+            {field: sort_value, '_id': {'$lt': doc_id}}
+        ]
+    }
+
+
+def next_page(docs, limit, field):
+    """Recibe limit + 1 documentos y regresa (pagina, cursor siguiente o None)."""
+    if len(docs) <= limit:
+        return docs, None
+
+    docs = docs[:limit]
+    last = docs[-1]
+    return docs, encode_cursor(last[field], last['_id'])
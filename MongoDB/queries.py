@@ -1,137 +1,512 @@
+import os
+import re
+import unicodedata
 from bson.objectid import ObjectId
 from datetime import datetime, timedelta
+from pymongo import DeleteOne, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from MongoDB.cache import UserCache
+from MongoDB.pagination import DEFAULT_PAGE_SIZE, clamp_page_size, keyset_filter, next_page
 
 #User queries
+EMPTY_USER_STATS = {
+    'total_posts': 0,
+    'followers_count': 0,
+    'following_count': 0,
+    'saved_posts_count': 0,
+    'total_likes': 0,
+    'total_comments': 0,
+    'viral_posts_count': 0
+}
+
+LOCATION_SEARCH_MODES = ('word', 'prefix', 'city', 'state', 'regex')
+
+def normalize_location(location):
+    # minusculas, sin acentos y con espacios colapsados: "Tonalá,  Jalisco" -> "tonala, jalisco"
+    location = unicodedata.normalize('NFKD', location or '')
+    location = ''.join(c for c in location if not unicodedata.combining(c))
+    return ' '.join(location.lower().split())
+
+def build_location_search(location):
+    full = normalize_location(location)
+    city, _, state = full.partition(',')
+    return {
+        'full': full,
+        'city': city.strip(),
+        'state': state.strip(),
+        'tokens': sorted(set(re.findall(r'\w+', full)))
+    }
+
+def _set_location_search(user_data):
+    personal_info = user_data.get('personal_info')
+    if isinstance(personal_info, dict) and 'location' in personal_info:
+        user_data['location_search'] = build_location_search(personal_info['location'])
+    elif 'personal_info.location' in user_data:
+        user_data['location_search'] = build_location_search(user_data['personal_info.location'])
+
+# Los documentos en cache se comparten entre requests: no se deben modificar
+user_cache = UserCache(
+    max_size=int(os.getenv('USER_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('USER_CACHE_TTL', '30'))
+)
+
 def get_user_by_id(db,user_id):
-    return db.users.find_one({'_id': ObjectId(user_id)})
+    user = user_cache.get_by_id(user_id)
+    if user is None:
+        user = db.users.find_one({'_id': ObjectId(user_id)}, {'location_search': 0})
+        if user:
+            user_cache.put(user)
+    return user
 
 def get_user_by_username(db,username):
-    return db.users.find_one({'username': username})
+    user = user_cache.get_by_username(username)
+    if user is None:
+        user = db.users.find_one({'username': username}, {'location_search': 0})
+        if user:
+            user_cache.put(user)
+    return user
+
+def _inc_user_stats(db, user_id, increments):
+    """$inc sobre users.stats; el documento en cache trae stats, asi que se invalida."""
+    db.users.update_one(
+        {'_id': ObjectId(user_id)},
+        {'$inc': {f'stats.{field}': value for field, value in increments.items()}}
+    )
+    user_cache.invalidate(user_id)
+
+def get_users_by_location (db, location, limit=20, mode='word', state=None):
+    normalized = normalize_location(location)
+
+    if mode == 'prefix':
+        # prefijo anclado sobre el campo normalizado, usa location_prefix
+        query = {'location_search.full': {'$regex': '^' + re.escape(normalized)}}
+    elif mode == 'word':
+        # cada palabra es prefijo de alguna palabra de la ubicacion, usa location_tokens
+        words = re.findall(r'\w+', normalized)
+        if not words:
+            raise ValueError('location must contain at least one word')
+        query = {'location_search.tokens': {'$all': [re.compile('^' + re.escape(w)) for w in words]}}
+    elif mode == 'city':
+        query = {'location_search.city': normalized}
+        if state:
+            query['location_search.state'] = normalize_location(state)
+    elif mode == 'state':
+        query = {'location_search.state': normalized}
+    elif mode == 'regex':
+        # busqueda anterior, recorre toda la coleccion
+        query = {'personal_info.location': {'$regex':location, '$options':'i'}}
+    else:
+        raise ValueError(f"mode must be one of {', '.join(LOCATION_SEARCH_MODES)}")
 
-def get_users_by_location (db, location, limit=20):
     return list(db.users.find(
-        {'personal_info.location': {'$regex':location, '$options':'i'}},
+        query,
         {'username':1, 'personal_info':1, 'stats':1}
         ).limit(limit))
 
+USER_CARD_PROJECTION = {
+    'username': 1,
+    'personal_info.first_name': 1,
+    'personal_info.last_name': 1,
+    'personal_info.location': 1,
+    'stats': 1
+}
+
+MAX_USER_BATCH = 500
+
+def _order_user_cards(keys, found):
+    users = []
+    missing = []
+    for key in keys:
+        card = found.get(key)
+        if card is None:
+            missing.append(key)
+        else:
+            users.append(card)
+    return users, missing
+
+def get_user_cards_by_ids(db, user_ids):
+    # Un solo $in; la respuesta respeta el orden pedido y reporta los ids que no existen
+    object_ids = {user_id: ObjectId(user_id) for user_id in user_ids if ObjectId.is_valid(user_id)}
+    cursor = db.users.find({'_id': {'$in': list(set(object_ids.values()))}}, USER_CARD_PROJECTION)
+    by_object_id = {card['_id']: card for card in cursor}
+    found = {user_id: by_object_id[oid] for user_id, oid in object_ids.items() if oid in by_object_id}
+    return _order_user_cards(user_ids, found)
+
+def get_user_cards_by_usernames(db, usernames):
+    cursor = db.users.find({'username': {'$in': list(set(usernames))}}, USER_CARD_PROJECTION)
+    found = {card['username']: card for card in cursor}
+    return _order_user_cards(usernames, found)
+
 def create_user(db, user_data):
-    result = db.users.insert_one(user_data)
-    return result.inserted_id
+    _set_location_search(user_data)
+    user_data.setdefault('stats', dict(EMPTY_USER_STATS))
+    # insert_one agrega el _id al documento, no hace falta volver a leerlo
+    db.users.insert_one(user_data)
+    return {key: value for key, value in user_data.items() if key != 'location_search'}
 
 def update_user(db,user_id, update_data):
     if '_id' in update_data:
         del update_data['_id']
-    result = db.users.update_one({'_id': ObjectId(user_id)}, {'$set':update_data})
-    return result
-
-def get_user_privacy_settings(db, user_id):
-    return db.users.find_one(
+    _set_location_search(update_data)
+    user = db.users.find_one_and_update(
         {'_id': ObjectId(user_id)},
-        {'privacy_settings': 1, 'username': 1}
+        {'$set':update_data},
+        projection={'location_search': 0},
+        return_document=ReturnDocument.AFTER
     )
 
+    if user is None:
+        user_cache.invalidate(user_id)
+        return None
+
+    user_cache.put(user)
+
+    # La tarjeta del autor esta embebida en viral_leaderboard
+    if any(key.startswith(('username', 'personal_info')) for key in update_data):
+        refresh_viral_leaderboard_author(db, user_id, user)
+
+    return user
+
+def backfill_location_search(db, batch_size=1000):
+    # Calcula location_search para usuarios creados antes de que existiera el campo
+    updated = 0
+    batch = []
+    cursor = db.users.find({'location_search': {'$exists': False}}, {'personal_info.location': 1})
+
+    for user in cursor:
+        location = user.get('personal_info', {}).get('location')
+        batch.append(UpdateOne({'_id': user['_id']}, {'$set': {'location_search': build_location_search(location)}}))
+
+        if len(batch) >= batch_size:
+            updated += db.users.bulk_write(batch, ordered=False).modified_count
+            batch = []
+
+    if batch:
+        updated += db.users.bulk_write(batch, ordered=False).modified_count
+
+    return updated
+
+def _project_user(user, field):
+    if user is None:
+        return None
+    projected = {'_id': user['_id'], 'username': user.get('username')}
+    if field in user:
+        projected[field] = user[field]
+    return projected
+
+def get_user_privacy_settings(db, user_id):
+    return _project_user(get_user_by_id(db, user_id), 'privacy_settings')
+
 def update_privacy_settings(db, user_id, privacy_data):
-    result = db.users.update_one(
+    settings = db.users.find_one_and_update(
         {'_id': ObjectId(user_id)},
-        {'$set': {'privacy_settings': privacy_data}}
+        {'$set': {'privacy_settings': privacy_data}},
+        projection={'privacy_settings': 1, 'username': 1},
+        return_document=ReturnDocument.AFTER
     )
-    return result
+    user_cache.invalidate(user_id)
+    return settings
 
 
 def get_notification_preferences(db, user_id):
-    return db.users.find_one(
-        {'_id': ObjectId(user_id)},
-        {'notification_preferences': 1, 'username': 1}
-    )
+    return _project_user(get_user_by_id(db, user_id), 'notification_preferences')
 
 
 def update_notification_preferences(db, user_id, notification_data):
-    result = db.users.update_one(
+    preferences = db.users.find_one_and_update(
         {'_id': ObjectId(user_id)},
-        {'$set': {'notification_preferences': notification_data}}
+        {'$set': {'notification_preferences': notification_data}},
+        projection={'notification_preferences': 1, 'username': 1},
+        return_document=ReturnDocument.AFTER
     )
-    return result
+    user_cache.invalidate(user_id)
+    return preferences
 
 #Post queries
-def get_posts_by_date_range(db, user_id, start_date, end_date):
-    return list(db.posts.find(
-        {'user_id': ObjectId(user_id),
+VIRAL_MIN_LIKES = 10
+# viral_leaderboard solo guarda los posts de esta ventana (un indice TTL borra los mas
+# viejos), asi el top-N recorre el volumen de la ventana y no el de todos los posts
+VIRAL_WINDOW_DAYS = 30
+
+def get_posts_by_date_range(db, user_id, start_date, end_date, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    limit = clamp_page_size(limit)
+    query = {
+        'user_id': ObjectId(user_id),
         'created_at': {
-        '$gte': start_date,
-        '$lte': end_date
+            '$gte': start_date,
+            '$lte': end_date
         }
-        }
-    ).sort('created_at', -1))
+    }
+
+    if cursor:
+        query.update(keyset_filter('created_at', cursor))
+
+    # limit + 1 para saber si hay otra pagina; usa el indice user_timeline
+    posts = list(db.posts.find(query).sort([('created_at', -1), ('_id', -1)]).limit(limit + 1))
+    return next_page(posts, limit, 'created_at')
+
+def clamp_viral_days(days):
+    if not days:
+        return VIRAL_WINDOW_DAYS
+    return max(1, min(days, VIRAL_WINDOW_DAYS))
 
 def get_viral_posts(db,days=30, min_likes=10, limit=50):
-    date_threshold = datetime.now() - timedelta(days=days)
+    date_threshold = datetime.now() - timedelta(days=clamp_viral_days(days))
+
+    # Lectura top-N sobre el indice engagement_rank del leaderboard materializado
+    return list(db.viral_leaderboard.find(
+        {
+            'created_at': {'$gte': date_threshold},
+            'likes_count': {'$gte': min_likes}
+        },
+        {'user_id': 0}
+    ).sort([('engagement_score', -1), ('_id', -1)]).limit(limit))
+
+def _parse_datetime(value, field):
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f'{field} must be an ISO 8601 date')
+    if not isinstance(value, datetime):
+        raise ValueError(f'{field} must be a date')
+    # Las fechas se guardan naive en hora local, como datetime.now()
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+def _validate_post(post_data):
+    # Todo se valida antes del insert: despues ya no se puede responder error sin dejar el post creado
+    user_id = post_data.get('user_id')
+    if isinstance(user_id, str) and ObjectId.is_valid(user_id):
+        user_id = ObjectId(user_id)
+    if not isinstance(user_id, ObjectId):
+        raise ValueError('user_id is required and must be an ObjectId')
+    post_data['user_id'] = user_id
 
+    post_data['created_at'] = _parse_datetime(post_data.get('created_at') or datetime.now(), 'created_at')
+
+    for field in ('likes_count', 'comments_count'):
+        value = post_data.get(field, 0)
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise ValueError(f'{field} must be a non-negative integer')
+        post_data[field] = value
+
+def create_post(db,post_data):
+    _validate_post(post_data)
+    if post_data['likes_count'] >= VIRAL_MIN_LIKES:
+        post_data['is_viral'] = True
+        post_data['viral_detected_at'] = datetime.now()
+    db.posts.insert_one(post_data)
+
+    _inc_user_stats(db, post_data['user_id'], {
+        'total_posts': 1,
+        'total_likes': post_data['likes_count'],
+        'total_comments': post_data['comments_count'],
+        'viral_posts_count': 1 if post_data.get('is_viral') else 0
+    })
+
+    if post_data.get('is_viral'):
+        refresh_viral_leaderboard_entry(db, post_data)
+
+    # post_data ya trae el _id asignado por insert_one
+    return post_data
+
+def increment_post_counters(db, post_id, likes=0, comments=0):
+    now = datetime.now()
+    # MongoDB guarda milisegundos; el post que se regresa debe tener la misma fecha guardada
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+    # Un solo update atomico: incrementa contadores y marca el post como viral al cruzar el umbral.
+    # Se pide el documento anterior: solo el update que cambio is_viral de falso a verdadero
+    # lo ve sin is_viral, aunque haya incrementos concurrentes
+    before = db.posts.find_one_and_update(
+        {'_id': ObjectId(post_id)},
+        [
+            {
+                '$set': {
+                    'likes_count': {'$add': [{'$ifNull': ['$likes_count', 0]}, likes]},
+                    'comments_count': {'$add': [{'$ifNull': ['$comments_count', 0]}, comments]}
+                }
+            },
+            {
+                '$set': {
+                    'is_viral': {'$or': [{'$eq': ['$is_viral', True]}, {'$gte': ['$likes_count', VIRAL_MIN_LIKES]}]}
+                }
+            },
+            {
+                '$set': {
+                    'viral_detected_at': {
+                        '$ifNull': ['$viral_detected_at', {'$cond': ['$is_viral', now, '$$REMOVE']}]
+                    }
+                }
+            }
+        ],
+        return_document=ReturnDocument.BEFORE
+    )
+
+    if before is None:
+        return None
+
+    # Mismo calculo que el pipeline, sobre el documento anterior
+    post = dict(before)
+    post['likes_count'] = before.get('likes_count', 0) + likes
+    post['comments_count'] = before.get('comments_count', 0) + comments
+    post['is_viral'] = before.get('is_viral') is True or post['likes_count'] >= VIRAL_MIN_LIKES
+    newly_viral = post['is_viral'] and before.get('is_viral') is not True
+    if post['is_viral'] and post.get('viral_detected_at') is None:
+        post['viral_detected_at'] = now
+
+    if post['is_viral'] and in_viral_window(post, now):
+        if newly_viral:
+            refresh_viral_leaderboard_entry(db, post)
+        else:
+            result = db.viral_leaderboard.update_one(
+                {'_id': post['_id']},
+                {'$set': {
+                    'likes_count': post['likes_count'],
+                    'comments_count': post['comments_count'],
+                    'engagement_score': engagement_score(post)
+                }}
+            )
+            # Viral de antes sin entrada (ej. sin autor en el rebuild): se agrega sin contarlo
+            if result.matched_count == 0:
+                refresh_viral_leaderboard_entry(db, post)
+
+    if post.get('user_id'):
+        _inc_user_stats(db, post['user_id'], {
+            'total_likes': likes,
+            'total_comments': comments,
+            'viral_posts_count': 1 if newly_viral else 0
+        })
+
+    return post
+
+#viral_leaderboard queries
+AUTHOR_CARD_PROJECTION = {
+    'username': 1,
+    'personal_info.first_name': 1,
+    'personal_info.last_name': 1
+}
+
+def engagement_score(post):
+    return post.get('likes_count', 0) + post.get('comments_count', 0) * 2
+
+def _author_card(author):
+    author = author or {}
+    personal_info = author.get('personal_info', {})
+    return {
+        'username': author.get('username'),
+        'personal_info': {
+            'first_name': personal_info.get('first_name'),
+            'last_name': personal_info.get('last_name')
+        }
+    }
+
+def in_viral_window(post, now=None):
+    # Posts viejos con created_at como string o sin fecha no entran al leaderboard
+    created_at = post.get('created_at')
+    return isinstance(created_at, datetime) and created_at >= (now or datetime.now()) - timedelta(days=VIRAL_WINDOW_DAYS)
+
+def refresh_viral_leaderboard_entry(db, post, author=None):
+    # Fuera de la ventana el TTL lo borraria y ninguna lectura lo alcanza; sin autor no hay tarjeta
+    if not in_viral_window(post) or post.get('user_id') is None:
+        return
+
+    if author is None:
+        author = db.users.find_one({'_id': post['user_id']}, AUTHOR_CARD_PROJECTION)
+
+    entry = {
+        'user_id': post['user_id'],
+        'description': post.get('description'),
+        'created_at': post.get('created_at'),
+        'location': post.get('location'),
+        'hashtags': post.get('hashtags', []),
+        'likes_count': post.get('likes_count', 0),
+        'comments_count': post.get('comments_count', 0),
+        'engagement_score': engagement_score(post),
+        'is_viral': True,
+        'user_info': _author_card(author)
+    }
+    db.viral_leaderboard.replace_one({'_id': post['_id']}, entry, upsert=True)
+
+def refresh_viral_leaderboard_author(db, user_id, author=None):
+    if author is None:
+        author = db.users.find_one({'_id': ObjectId(user_id)}, AUTHOR_CARD_PROJECTION)
+    if author:
+        db.viral_leaderboard.update_many(
+            {'user_id': author['_id']},
+            {'$set': {'user_info': _author_card(author)}}
+        )
+
+def rebuild_viral_leaderboard(db):
+    # Reconstruye todo el leaderboard desde posts (carga inicial o reparacion)
     pipeline = [
         {
             '$match': {
-                'created_at': {'$gte': date_threshold},
                 'is_viral': True,
-                'likes_count': {'$gte': min_likes}
+                'created_at': {'$gte': datetime.now() - timedelta(days=VIRAL_WINDOW_DAYS)}
             }
         },
         {
-            '$lookup':{
+            '$lookup': {
                 'from': 'users',
                 'localField': 'user_id',
                 'foreignField': '_id',
-                'as': 'user_info'
-            }
-        },
-        {
-            '$unwind': '$user_info'
-        },
-        {
-            '$addFields':{
-                'engagements_score':{
-                    '$add': ['$likes_count', {'$multiply': ['$comments_count', 2]}]
-                }
+                'as': 'author'
             }
         },
         {
-            '$sort': {'engagement_score': -1}
-        },
-        {
-            '$limit' : limit
+            '$unwind': '$author'
         },
         {
             '$project': {
                 '_id': 1,
+                'user_id': 1,
                 'description': 1,
                 'created_at': 1,
                 'location': 1,
                 'hashtags': 1,
                 'likes_count': 1,
                 'comments_count': 1,
-                'engagement_score': 1,
+                'engagement_score': {
+                    '$add': ['$likes_count', {'$multiply': ['$comments_count', 2]}]
+                },
                 'is_viral': 1,
-                'user_info.username': 1,
-                'user_info.personal_info.first_name': 1,
-                'user_info.personal_info.last_name': 1
-            }     
+                'user_info.username': '$author.username',
+                'user_info.personal_info.first_name': '$author.personal_info.first_name',
+                'user_info.personal_info.last_name': '$author.personal_info.last_name'
+            }
+        },
+        {
+            # $out reemplaza la coleccion de forma atomica y conserva sus indices
+            '$out': 'viral_leaderboard'
         }
     ]
-    return list(db.posts.aggregate(pipeline))
-
-def create_post(db,post_data):
-    if post_data.get('likes_count', 0) >= 10:
-        post_data['is_viral'] = True
-        post_data['viral_detected_at'] = datetime.now()
-    result = db.posts.insert_one(post_data)
-    return result.inserted_id
+    db.posts.aggregate(pipeline)
+    return db.viral_leaderboard.estimated_document_count()
 
 # user_relationships queries
-def get_user_following(db, user_id, limit = 100):
+def get_user_following(db, user_id, limit = 100, cursor=None):
+    limit = clamp_page_size(limit, default=100)
+    match = {
+        'follower_id': ObjectId(user_id),
+        'status': 'active'
+    }
+
+    if cursor:
+        match.update(keyset_filter('followed_at', cursor))
+
+    # Primero se pagina sobre following_timeline y solo despues se hace el join
     pipeline = [
         {
-            '$match': {
-                'follower_id': ObjectId(user_id),
-                'status': 'active'
-            }
+            '$match': match
+        },
+        {
+            '$sort': {'followed_at': -1, '_id': -1}
+        },
+        {
+            '$limit': limit + 1
         },
         {
             '$lookup': {
@@ -142,17 +517,11 @@ def get_user_following(db, user_id, limit = 100):
             }
         },
         {
-            '$unwind': '$followed_user'
-        },
-        {
-            '$sort': {'followed_at': -1}
-        },
-        {
-            '$limit': limit
+            '$unwind': {'path': '$followed_user', 'preserveNullAndEmptyArrays': True}
         },
         {
             '$project': {
-                '_id': 0,
+                '_id': 1,
                 'followed_user_id': '$following_id',
                 'username': '$followed_user.username',
                 'full_name': {
@@ -167,19 +536,127 @@ def get_user_following(db, user_id, limit = 100):
             }
         }
     ]
-    
-    return list(db.user_relationships.aggregate(pipeline))
+
+    following, next_cursor = next_page(list(db.user_relationships.aggregate(pipeline)), limit, 'followed_at')
+
+    # El cursor se calcula antes de descartar relaciones con usuarios borrados
+    for followed in following:
+        del followed['_id']
+    return [f for f in following if 'username' in f], next_cursor
+
+# Indices unicos ya verificados en este proceso, ver _require_unique_index
+_verified_unique_indexes = set()
+# None hasta la primera consulta; los standalone no aceptan transacciones
+_transactions_supported = None
+_client_bulk_write_supported = None
+
+def _require_unique_index(db, collection_name, index_name):
+    """Las escrituras idempotentes dependen del indice unico; sin el duplicarian documentos y contadores."""
+    key = (db.name, collection_name, index_name)
+    if key in _verified_unique_indexes:
+        return
+
+    index = db[collection_name].index_information().get(index_name)
+    if not index or not index.get('unique'):
+        raise RuntimeError(f"Missing unique index {collection_name}.{index_name}, run python3 migrate.py")
+    _verified_unique_indexes.add(key)
+
+def _supports_transactions(db):
+    global _transactions_supported
+    if _transactions_supported is None:
+        hello = db.client.admin.command('hello')
+        _transactions_supported = 'setName' in hello or hello.get('msg') == 'isdbgrid'
+    return _transactions_supported
+
+def _write_follow(db, write):
+    """write(session) cambia la relacion y los contadores juntos.
+
+    En replica set o mongos corre en una transaccion. En un standalone son escrituras
+    separadas: una falla a la mitad se repara con python3 migrate.py --recompute-stats.
+    """
+    if not _supports_transactions(db):
+        return write(None)
+    with db.client.start_session() as session:
+        return session.with_transaction(write)
+
+def follow_user(db, follower_id, following_id):
+    follower_id = ObjectId(follower_id)
+    following_id = ObjectId(following_id)
+
+    if follower_id == following_id:
+        raise ValueError('A user cannot follow themselves')
+    _require_unique_index(db, 'user_relationships', 'unique_relationship')
+
+    def write(session):
+        # Reactiva una relacion inactiva o crea una nueva; si ya esta activa choca con unique_relationship
+        result = db.user_relationships.update_one(
+            {'follower_id': follower_id, 'following_id': following_id, 'status': {'$ne': 'active'}},
+            {'$set': {'status': 'active', 'followed_at': datetime.now()}},
+            upsert=True,
+            session=session
+        )
+        if result.upserted_id is None and result.modified_count == 0:
+            return False
+        _update_follow_counters(db, follower_id, following_id, 1, session)
+        return True
+
+    try:
+        followed = _write_follow(db, write)
+    except DuplicateKeyError:
+        return False
+
+    # Despues del commit, para que un lector no vuelva a cachear los contadores anteriores
+    if followed:
+        user_cache.invalidate(follower_id)
+        user_cache.invalidate(following_id)
+    return followed
+
+
+def unfollow_user(db, follower_id, following_id):
+    follower_id = ObjectId(follower_id)
+    following_id = ObjectId(following_id)
+
+    def write(session):
+        result = db.user_relationships.delete_one(
+            {'follower_id': follower_id, 'following_id': following_id, 'status': 'active'},
+            session=session
+        )
+        if result.deleted_count:
+            _update_follow_counters(db, follower_id, following_id, -1, session)
+        return result
+
+    result = _write_follow(db, write)
+    if result.deleted_count:
+        user_cache.invalidate(follower_id)
+        user_cache.invalidate(following_id)
+    return result
+
+
+def _update_follow_counters(db, follower_id, following_id, delta, session=None):
+    db.users.bulk_write([
+        UpdateOne({'_id': follower_id}, {'$inc': {'stats.following_count': delta}}),
+        UpdateOne({'_id': following_id}, {'$inc': {'stats.followers_count': delta}})
+    ], ordered=False, session=session)
 
 #searched_history queries
+MAX_SEARCH_HISTORY = 10
+
 def get_search_history(db, user_id, limit=10):
+    # Un documento por usuario con las busquedas mas recientes primero
     pipeline = [
         {
-            '$match': {'user_id': ObjectId(user_id)}
+            '$match': {'_id': ObjectId(user_id)}
+        },
+        {
+            '$project': {'entries': {'$slice': ['$entries', limit]}}
+        },
+        {
+            '$unwind': {'path': '$entries', 'includeArrayIndex': 'position'}
         },
         {
             '$lookup': {
                 'from': 'users',
-                'localField': 'searched_user_id',
+                'localField': 'entries.searched_user_id',
                 'foreignField': '_id',
                 'as': 'searched_user'
             }
@@ -188,17 +665,14 @@ def get_search_history(db, user_id, limit=10):
             '$unwind': '$searched_user'
         },
         {
-            '$sort': {'searched_at': -1}
-        },
-        {
-            '$limit': limit
+            '$sort': {'position': 1}
         },
         {
             '$project': {
                 '_id': 0,
-                'searched_user_id': 1,
+                'searched_user_id': '$entries.searched_user_id',
                 'searched_username': '$searched_user.username',
-                'searched_at': 1
+                'searched_at': '$entries.searched_at'
             }
         }
     ]
@@ -207,25 +681,150 @@ def get_search_history(db, user_id, limit=10):
 
 
 def add_to_search_history(db, user_id, searched_user_id):
-    search_entry = {
-        'user_id': ObjectId(user_id),
-        'searched_user_id': ObjectId(searched_user_id),
-        'searched_at': datetime.now()
+    searched_user_id = ObjectId(searched_user_id)
+    now = datetime.now()
+    entry = {
+        'searched_user_id': searched_user_id,
+        'searched_at': now
     }
-    
-    db.search_history.insert_one(search_entry)
-    
-    # Keep last 10
-    all_searches = list(db.search_history.find(
-        {'user_id': ObjectId(user_id)}
-    ).sort('searched_at', -1))
-    
-    if len(all_searches) > 10:
-        ids_to_delete = [s['_id'] for s in all_searches[10:]]
-        db.search_history.delete_many({'_id': {'$in': ids_to_delete}})
+
+    # Una sola escritura atomica: quita la busqueda repetida, la pone al inicio y recorta
+    db.search_history.update_one(
+        {'_id': ObjectId(user_id)},
+        [
+            {
+                '$set': {
+                    'entries': {
+                        '$slice': [
+                            {
+                                '$concatArrays': [
+                                    [entry],
+                                    {
+                                        '$filter': {
+                                            'input': {'$ifNull': ['$entries', []]},
+                                            'cond': {'$ne': ['$$this.searched_user_id', searched_user_id]}
+                                        }
+                                    }
+                                ]
+                            },
+                            MAX_SEARCH_HISTORY
+                        ]
+                    },
+                    'updated_at': now
+                }
+            }
+        ],
+        upsert=True
+    )
     
     return True
 
+#bulk writes (best_friends, saved_posts)
+MAX_BULK_ITEMS = 1000
+
+def _bulk_add(collection, user_id, field, entries):
+    """entries: lista de (id, campos extra). Una sola escritura unordered con un resultado por item."""
+    user_oid = ObjectId(user_id)
+    results = [None] * len(entries)
+    operations = []
+    positions = []
+    seen = set()
+
+    for i, (item_id, extra) in enumerate(entries):
+        if not ObjectId.is_valid(item_id):
+            results[i] = {field: item_id, 'status': 'invalid_id'}
+            continue
+
+        item_oid = ObjectId(item_id)
+        if item_oid in seen:
+            results[i] = {field: item_id, 'status': 'duplicate'}
+            continue
+
+        seen.add(item_oid)
+        operations.append(InsertOne({'user_id': user_oid, field: item_oid, **extra}))
+        positions.append(i)
+
+    failed = {}
+    if operations:
+        try:
+            collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # los indices unicos reportan los que ya existian con el codigo 11000
+            for error in e.details.get('writeErrors', []):
+                failed[error['index']] = 'duplicate' if error.get('code') == 11000 else 'error'
+
+    inserted = 0
+    for op_index, i in enumerate(positions):
+        status = failed.get(op_index, 'inserted')
+        inserted += status == 'inserted'
+        results[i] = {field: entries[i][0], 'status': status}
+
+    return results, inserted
+
+
+def _supports_client_bulk_write(db):
+    # bulkWrite a nivel cliente (MongoDB 8.0, wire version 25) reporta deletedCount por operacion
+    global _client_bulk_write_supported
+    if _client_bulk_write_supported is None:
+        hello = db.client.admin.command('hello')
+        _client_bulk_write_supported = hello.get('maxWireVersion', 0) >= 25
+    return _client_bulk_write_supported
+
+def _bulk_remove(collection, user_id, field, item_ids):
+    """Un resultado por item; el total borrado, que ajusta los contadores, siempre es exacto.
+
+    En MongoDB 8.0+ es una sola escritura unordered de DeleteOne y cada id se clasifica con el
+    deletedCount de su operacion. En versiones anteriores bulk_write solo regresa el total, asi
+    que primero se leen los ids existentes y luego se borran: si otra peticion borra el mismo id
+    entre las dos, ambas lo reportan como 'removed' aunque solo una lo conto.
+    """
+    user_oid = ObjectId(user_id)
+    results = [None] * len(item_ids)
+    operations = []
+    positions = []
+    seen = set()
+
+    for i, item_id in enumerate(item_ids):
+        if not ObjectId.is_valid(item_id):
+            results[i] = {field: item_id, 'status': 'invalid_id'}
+            continue
+
+        item_oid = ObjectId(item_id)
+        if item_oid in seen:
+            results[i] = {field: item_id, 'status': 'duplicate'}
+            continue
+
+        seen.add(item_oid)
+        operations.append({'user_id': user_oid, field: item_oid})
+        positions.append(i)
+
+    statuses = []
+    deleted = 0
+    if operations and _supports_client_bulk_write(collection.database):
+        result = collection.database.client.bulk_write(
+            [DeleteOne(query, namespace=collection.full_name) for query in operations],
+            ordered=False, verbose_results=True
+        )
+        deleted = result.deleted_count
+        statuses = [
+            'removed' if result.delete_results[op_index].deleted_count else 'not_found'
+            for op_index in range(len(operations))
+        ]
+    elif operations:
+        cursor = collection.find(
+            {'user_id': user_oid, field: {'$in': [query[field] for query in operations]}},
+            {field: 1, '_id': 0}
+        )
+        existing = {doc[field] for doc in cursor}
+        if existing:
+            deleted = collection.delete_many({'user_id': user_oid, field: {'$in': list(existing)}}).deleted_count
+        statuses = ['removed' if query[field] in existing else 'not_found' for query in operations]
+
+    for op_index, i in enumerate(positions):
+        results[i] = {field: item_ids[i], 'status': statuses[op_index]}
+
+    return results, deleted
+
 #best_friends queries
 def get_best_friends(db, user_id, limit=20):
     pipeline = [
@@ -270,23 +869,18 @@ def get_best_friends(db, user_id, limit=20):
 
 
 def add_best_friend(db, user_id, friend_id):
-    # Not in the list
-    existing = db.best_friends.find_one({
-        'user_id': ObjectId(user_id),
-        'friend_id': ObjectId(friend_id)
-    })
-    
-    if existing:
-        return None 
-    
-    best_friend_entry = {
-        'user_id': ObjectId(user_id),
-        'friend_id': ObjectId(friend_id),
-        'added_at': datetime.now(),
-    }
-    
-    result = db.best_friends.insert_one(best_friend_entry)
-    return result.inserted_id
+    # Upsert idempotente: upserted_id solo existe si el amigo no estaba en la lista
+    try:
+        result = db.best_friends.update_one(
+            {'user_id': ObjectId(user_id), 'friend_id': ObjectId(friend_id)},
+            {'$setOnInsert': {'added_at': datetime.now()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Otro request concurrente inserto el mismo par primero (unique_friendship)
+        return None
+
+    return result.upserted_id
 
 
 def remove_best_friend(db, user_id, friend_id):
@@ -297,6 +891,17 @@ def remove_best_friend(db, user_id, friend_id):
     })
     return result
 
+
+def bulk_add_best_friends(db, user_id, friend_ids):
+    now = datetime.now()
+    results, _ = _bulk_add(db.best_friends, user_id, 'friend_id', [(fid, {'added_at': now}) for fid in friend_ids])
+    return results
+
+
+def bulk_remove_best_friends(db, user_id, friend_ids):
+    results, _ = _bulk_remove(db.best_friends, user_id, 'friend_id', friend_ids)
+    return results
+
 #saved_post queries
 def get_saved_posts(db, user_id, limit=50):
     pipeline = [
@@ -350,24 +955,20 @@ def get_saved_posts(db, user_id, limit=50):
 
 
 def save_post(db, user_id, post_id, collection_name="Favoritos"):
-    # do not exists
-    existing = db.saved_posts.find_one({
-        'user_id': ObjectId(user_id),
-        'post_id': ObjectId(post_id)
-    })
-    
-    if existing:
+    # Upsert idempotente: upserted_id solo existe si el post no estaba guardado
+    try:
+        result = db.saved_posts.update_one(
+            {'user_id': ObjectId(user_id), 'post_id': ObjectId(post_id)},
+            {'$setOnInsert': {'saved_at': datetime.now(), 'collection_name': collection_name}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Otro request concurrente inserto el mismo par primero (unique_saved_post)
         return None
-    
-    saved_entry = {
-        'user_id': ObjectId(user_id),
-        'post_id': ObjectId(post_id),
-        'saved_at': datetime.now(),
-        'collection_name': collection_name
-    }
-    
-    result = db.saved_posts.insert_one(saved_entry)
-    return result.inserted_id
+
+    if result.upserted_id is not None:
+        _inc_user_stats(db, user_id, {'saved_posts_count': 1})
+    return result.upserted_id
 
 
 def unsave_post(db, user_id, post_id):
@@ -375,10 +976,37 @@ def unsave_post(db, user_id, post_id):
         'user_id': ObjectId(user_id),
         'post_id': ObjectId(post_id)
     })
+    if result.deleted_count:
+        _inc_user_stats(db, user_id, {'saved_posts_count': -1})
     return result
 
+
+def bulk_save_posts(db, user_id, items):
+    """items: lista de (post_id, collection_name)."""
+    now = datetime.now()
+    entries = [
+        (post_id, {'saved_at': now, 'collection_name': collection_name})
+        for post_id, collection_name in items
+    ]
+    results, inserted = _bulk_add(db.saved_posts, user_id, 'post_id', entries)
+    if inserted:
+        _inc_user_stats(db, user_id, {'saved_posts_count': inserted})
+    return results
+
+
+def bulk_unsave_posts(db, user_id, post_ids):
+    results, deleted = _bulk_remove(db.saved_posts, user_id, 'post_id', post_ids)
+    if deleted:
+        _inc_user_stats(db, user_id, {'saved_posts_count': -deleted})
+    return results
+
 #pipeline summary
-def get_profile_summary(db, user_id):
+def get_profile_summary(db, user_id, source='stats'):
+    if source == 'stats':
+        return _get_profile_summary_from_stats(db, user_id)
+    if source != 'aggregate':
+        raise ValueError('source must be stats or aggregate')
+
     pipeline = [
         {
             '$match': {'_id': ObjectId(user_id)}
@@ -472,4 +1100,72 @@ def get_profile_summary(db, user_id):
     ]
     
     result = list(db.users.aggregate(pipeline))
-    return result[0] if result else None
\ No newline at end of file
+    return result[0] if result else None
+
+
+def _get_profile_summary_from_stats(db, user_id):
+    # Lee los contadores que mantienen las escrituras, sin recorrer posts ni relaciones
+    user = db.users.find_one(
+        {'_id': ObjectId(user_id)},
+        {'username': 1, 'personal_info': 1, 'stats': 1}
+    )
+    if user is None:
+        return None
+
+    stats = {**EMPTY_USER_STATS, **user.get('stats', {})}
+    total_posts = stats['total_posts']
+    user['summary'] = {
+        'total_posts': total_posts,
+        'viral_posts_count': stats['viral_posts_count'],
+        'followers_count': stats['followers_count'],
+        'following_count': stats['following_count'],
+        'total_likes': stats['total_likes'],
+        'total_comments': stats['total_comments'],
+        'avg_likes_per_post': round(stats['total_likes'] / total_posts, 2) if total_posts else 0,
+        'main_location': user.get('personal_info', {}).get('location')
+    }
+    return user
+
+
+def recompute_user_stats(db):
+    # Recalcula users.stats desde las colecciones (carga inicial o reparacion)
+    db.users.update_many({}, {'$set': {'stats': dict(EMPTY_USER_STATS)}})
+
+    def merge_into_users(fields):
+        return {
+            '$merge': {
+                'into': 'users',
+                'on': '_id',
+                'whenMatched': [{'$set': {f'stats.{field}': f'$$new.{field}' for field in fields}}],
+                'whenNotMatched': 'discard'
+            }
+        }
+
+    db.posts.aggregate([
+        {
+            '$group': {
+                '_id': '$user_id',
+                'total_posts': {'$sum': 1},
+                'total_likes': {'$sum': '$likes_count'},
+                'total_comments': {'$sum': '$comments_count'},
+                'viral_posts_count': {'$sum': {'$cond': ['$is_viral', 1, 0]}}
+            }
+        },
+        merge_into_users(['total_posts', 'total_likes', 'total_comments', 'viral_posts_count'])
+    ])
+    db.user_relationships.aggregate([
+        {'$match': {'status': 'active'}},
+        {'$group': {'_id': '$follower_id', 'following_count': {'$sum': 1}}},
+        merge_into_users(['following_count'])
+    ])
+    db.user_relationships.aggregate([
+        {'$match': {'status': 'active'}},
+        {'$group': {'_id': '$following_id', 'followers_count': {'$sum': 1}}},
+        merge_into_users(['followers_count'])
+    ])
+    db.saved_posts.aggregate([
+        {'$group': {'_id': '$user_id', 'saved_posts_count': {'$sum': 1}}},
+        merge_into_users(['saved_posts_count'])
+    ])
+    # Solo el cache de este proceso; los demas workers expiran por TTL
+    user_cache.clear()
@@ -1,35 +1,58 @@
 import falcon
+import json
 from bson.objectid import ObjectId
+from collections import Counter
 from datetime import datetime
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from MongoDB import queries
+from MongoDB import async_queries, queries
+from MongoDB.instrumentation import profiler
+from MongoDB.pagination import DEFAULT_PAGE_SIZE, clamp_page_size
 
-def convert_objectid_to_str(doc):
-    if doc is None:
-        return None
-    
-    if isinstance(doc, list):
-        return [convert_objectid_to_str(item) for item in doc]
-    
-    if isinstance(doc, dict):
-        for key, value in doc.items():
-            if isinstance(value, ObjectId):
-                doc[key] = str(value)
-            elif isinstance(value, datetime):
-                doc[key] = value.isoformat()
-            elif isinstance(value, dict):
-                doc[key] = convert_objectid_to_str(value)
-            elif isinstance(value, list):
-                doc[key] = [convert_objectid_to_str(item) if isinstance(item, (dict, ObjectId)) else item for item in value]
-        return doc
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson')
+
+async def read_bulk_items(req):
+    """Lee un arreglo JSON o NDJSON (un item por linea) del body."""
+    body = await req.stream.read()
+    content_type = (req.content_type or '').split(';')[0].strip()
+    
+    try:
+        if content_type in NDJSON_TYPES:
+            items = [json.loads(line) for line in body.decode('utf-8').splitlines() if line.strip()]
+        else:
+            items = json.loads(body or b'null')
+    except ValueError:
+        raise falcon.HTTPBadRequest(description='Body must be a JSON array or NDJSON')
     
-    if isinstance(doc, ObjectId):
-        return str(doc)
+    if not isinstance(items, list) or not items:
+        raise falcon.HTTPBadRequest(description='Body must contain at least one item')
+    if len(items) > queries.MAX_BULK_ITEMS:
+        raise falcon.HTTPBadRequest(description=f'At most {queries.MAX_BULK_ITEMS} items per request')
     
-    return doc
+    return items
+
+def get_csv_param(req, name):
+    """Acepta ?ids=a,b,c y ?ids=a&ids=b; Falcon no separa por comas (auto_parse_qs_csv esta apagado)."""
+    values = req.get_param_as_list(name)
+    if values is None:
+        return None
+    return [key.strip() for value in values for key in value.split(',') if key.strip()]
+
+def bulk_item_id(item, field):
+    # Cada item puede ser el id como string o un objeto con el campo
+    if isinstance(item, dict):
+        return item.get(field)
+    return item
+
+def bulk_response(user_id, results):
+    return {
+        'user_id': user_id,
+        'count': len(results),
+        'summary': dict(Counter(result['status'] for result in results)),
+        'results': results
+    }
 
 #user
 class UserResource:
@@ -38,10 +61,9 @@ class UserResource:
         self.db = db
     
     async def on_get(self, req, resp, user_id):
-        user = queries.get_user_by_id(self.db, user_id)
+        user = await async_queries.get_user_by_id(self.db, user_id)
         
         if user:
-            user = convert_objectid_to_str(user)
             resp.media = user
             resp.status = falcon.HTTP_200
         else:
@@ -51,15 +73,13 @@ class UserResource:
     async def on_put(self, req, resp, user_id):
         try:
             update_data = await req.media
-            result = queries.update_user(self.db, user_id, update_data)
+            # Regresa el documento ya actualizado en el mismo round trip
+            updated_user = await async_queries.update_user(self.db, user_id, update_data)
             
-            if result.matched_count == 0:
+            if updated_user is None:
                 resp.status = falcon.HTTP_404
                 resp.media = {'error': 'User not found'}
             else:
-                # Obtener el usuario actualizado
-                updated_user = queries.get_user_by_id(self.db, user_id)
-                updated_user = convert_objectid_to_str(updated_user)
                 resp.media = updated_user
                 resp.status = falcon.HTTP_200
         except Exception as e:
@@ -74,9 +94,8 @@ class UsersResource:
         username = req.get_param('username')
         
         if username:
-            user = queries.get_user_by_username(self.db, username)
+            user = await async_queries.get_user_by_username(self.db, username)
             if user:
-                user = convert_objectid_to_str(user)
                 resp.media = user
                 resp.status = falcon.HTTP_200
             else:
@@ -89,11 +108,7 @@ class UsersResource:
     async def on_post(self, req, resp):
         try:
             user_data = await req.media
-            inserted_id = queries.create_user(self.db, user_data)
-            
-            # Obtener el usuario creado
-            user = queries.get_user_by_id(self.db, str(inserted_id))
-            user = convert_objectid_to_str(user)
+            user = await async_queries.create_user(self.db, user_data)
             
             resp.media = user
             resp.status = falcon.HTTP_201
@@ -108,12 +123,14 @@ class UsersByLocationResource:
         try:
             location = req.get_param('location', required=True)
             limit = req.get_param_as_int('limit', default=20)
+            mode = req.get_param('mode', default='word')
+            state = req.get_param('state')
             
-            users = queries.get_users_by_location(self.db, location, limit)
-            users = convert_objectid_to_str(users)
+            users = await async_queries.get_users_by_location(self.db, location, limit, mode, state)
             
             resp.media = {
                 'location': location,
+                'mode': mode,
                 'count': len(users),
                 'users': users
             }
@@ -121,16 +138,55 @@ class UsersByLocationResource:
         except Exception as e:
             raise falcon.HTTPBadRequest(description=str(e))
 
+class UsersBatchResource:
+
+    def __init__(self, db):
+        self.db = db
+    
+    async def on_get(self, req, resp):
+        ids = get_csv_param(req, 'ids')
+        usernames = get_csv_param(req, 'usernames')
+        await self._lookup(resp, ids, usernames)
+    
+    async def on_post(self, req, resp):
+        data = await req.media
+        if not isinstance(data, dict):
+            raise falcon.HTTPBadRequest(description='Body must be an object with ids or usernames')
+        await self._lookup(resp, data.get('ids'), data.get('usernames'))
+    
+    async def _lookup(self, resp, ids, usernames):
+        if bool(ids) == bool(usernames):
+            raise falcon.HTTPBadRequest(description='Send either ids or usernames')
+        
+        keys = ids or usernames
+        if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+            raise falcon.HTTPBadRequest(description='ids and usernames must be lists of strings')
+        if len(keys) > queries.MAX_USER_BATCH:
+            raise falcon.HTTPBadRequest(
+                description=f'At most {queries.MAX_USER_BATCH} users per request'
+            )
+        
+        if ids:
+            users, missing = await async_queries.get_user_cards_by_ids(self.db, ids)
+        else:
+            users, missing = await async_queries.get_user_cards_by_usernames(self.db, usernames)
+        
+        resp.media = {
+            'count': len(users),
+            'users': users,
+            'missing': missing
+        }
+        resp.status = falcon.HTTP_200
+
 class PrivacySettingsResource:
     
     def __init__(self, db):
         self.db = db
     
     async def on_get(self, req, resp, user_id):
-        settings = queries.get_user_privacy_settings(self.db, user_id)
+        settings = await async_queries.get_user_privacy_settings(self.db, user_id)
         
         if settings:
-            settings = convert_objectid_to_str(settings)
             resp.media = settings
             resp.status = falcon.HTTP_200
         else:
@@ -140,15 +196,12 @@ class PrivacySettingsResource:
     async def on_put(self, req, resp, user_id):
         try:
             privacy_data = await req.media
-            result = queries.update_privacy_settings(self.db, user_id, privacy_data)
+            settings = await async_queries.update_privacy_settings(self.db, user_id, privacy_data)
             
-            if result.matched_count == 0:
+            if settings is None:
                 resp.status = falcon.HTTP_404
                 resp.media = {'error': 'User not found'}
             else:
-                # Obtener configuración actualizada
-                settings = queries.get_user_privacy_settings(self.db, user_id)
-                settings = convert_objectid_to_str(settings)
                 resp.media = settings
                 resp.status = falcon.HTTP_200
         except Exception as e:
@@ -161,10 +214,9 @@ class NotificationPreferencesResource:
         self.db = db
     
     async def on_get(self, req, resp, user_id):
-        preferences = queries.get_notification_preferences(self.db, user_id)
+        preferences = await async_queries.get_notification_preferences(self.db, user_id)
         
         if preferences:
-            preferences = convert_objectid_to_str(preferences)
             resp.media = preferences
             resp.status = falcon.HTTP_200
         else:
@@ -174,15 +226,12 @@ class NotificationPreferencesResource:
     async def on_put(self, req, resp, user_id):
         try:
             notification_data = await req.media
-            result = queries.update_notification_preferences(self.db, user_id, notification_data)
+            preferences = await async_queries.update_notification_preferences(self.db, user_id, notification_data)
             
-            if result.matched_count == 0:
+            if preferences is None:
                 resp.status = falcon.HTTP_404
                 resp.media = {'error': 'User not found'}
             else:
-                # Obtener preferencias actualizadas
-                preferences = queries.get_notification_preferences(self.db, user_id)
-                preferences = convert_objectid_to_str(preferences)
                 resp.media = preferences
                 resp.status = falcon.HTTP_200
         except Exception as e:
@@ -199,20 +248,25 @@ class PostsByDateRangeResource:
             user_id = req.get_param('user_id', required=True)
             start_date_str = req.get_param('start_date', required=True)
             end_date_str = req.get_param('end_date', required=True)
+            limit = clamp_page_size(req.get_param_as_int('limit', default=DEFAULT_PAGE_SIZE))
+            cursor = req.get_param('cursor')
             
             # Convertir strings a datetime
             start_date = datetime.fromisoformat(start_date_str.replace('Z', '+00:00'))
             end_date = datetime.fromisoformat(end_date_str.replace('Z', '+00:00'))
             
-            posts = queries.get_posts_by_date_range(self.db, user_id, start_date, end_date)
-            posts = convert_objectid_to_str(posts)
+            posts, next_cursor = await async_queries.get_posts_by_date_range(
+                self.db, user_id, start_date, end_date, limit, cursor
+            )
             
             resp.media = {
                 'user_id': user_id,
                 'start_date': start_date_str,
                 'end_date': end_date_str,
+                'limit': limit,
                 'count': len(posts),
-                'posts': posts
+                'posts': posts,
+                'next_cursor': next_cursor
             }
             resp.status = falcon.HTTP_200
         except Exception as e:
@@ -225,12 +279,12 @@ class ViralPostsResource:
         self.db = db
     
     async def on_get(self, req, resp):
-        days = req.get_param_as_int('days', default=30)
+        # El leaderboard solo cubre VIRAL_WINDOW_DAYS; criteria reporta la ventana usada
+        days = queries.clamp_viral_days(req.get_param_as_int('days', default=queries.VIRAL_WINDOW_DAYS))
         min_likes = req.get_param_as_int('min_likes', default=10)
         limit = req.get_param_as_int('limit', default=50)
         
-        viral_posts = queries.get_viral_posts(self.db, days, min_likes, limit)
-        viral_posts = convert_objectid_to_str(viral_posts)
+        viral_posts = await async_queries.get_viral_posts(self.db, days, min_likes, limit)
         
         resp.media = {
             'criteria': {
@@ -252,33 +306,50 @@ class PostsResource:
     async def on_post(self, req, resp):
         try:
             post_data = await req.media
+            if not isinstance(post_data, dict):
+                raise ValueError('Body must be an object')
             
-            # Convertir user_id a ObjectId si viene como string
-            if 'user_id' in post_data and isinstance(post_data['user_id'], str):
-                post_data['user_id'] = ObjectId(post_data['user_id'])
-            
-            # Convertir tagged_users a ObjectIds
+            # Convertir tagged_users a ObjectIds; user_id y created_at los valida create_post
             if 'tagged_users' in post_data:
                 post_data['tagged_users'] = [
                     ObjectId(uid) if isinstance(uid, str) else uid 
                     for uid in post_data['tagged_users']
                 ]
             
-            # Asegurar que tenga created_at
-            if 'created_at' not in post_data:
-                post_data['created_at'] = datetime.now()
-            
-            inserted_id = queries.create_post(self.db, post_data)
-            
-            # Obtener el post creado
-            post = self.db.posts.find_one({'_id': inserted_id})
-            post = convert_objectid_to_str(post)
+            post = await async_queries.create_post(self.db, post_data)
             
             resp.media = post
             resp.status = falcon.HTTP_201
         except Exception as e:
             raise falcon.HTTPBadRequest(description=str(e))
 
+class PostEngagementResource:
+
+    def __init__(self, db):
+        self.db = db
+
+    async def on_post(self, req, resp, post_id):
+        try:
+            data = await req.media
+            likes = int(data.get('likes', 0))
+            comments = int(data.get('comments', 0))
+
+            post = await async_queries.increment_post_counters(self.db, post_id, likes, comments)
+
+            if post is None:
+                resp.status = falcon.HTTP_404
+                resp.media = {'error': 'Post not found'}
+            else:
+                resp.media = {
+                    '_id': post['_id'],
+                    'likes_count': post['likes_count'],
+                    'comments_count': post['comments_count'],
+                    'is_viral': post.get('is_viral', False)
+                }
+                resp.status = falcon.HTTP_200
+        except Exception as e:
+            raise falcon.HTTPBadRequest(description=str(e))
+
 #user_relationships
 class UserFollowingResource:
     """Recurso para obtener usuarios seguidos"""
@@ -288,16 +359,54 @@ class UserFollowingResource:
     
     async def on_get(self, req, resp, user_id):
         """GET /mongo/users/{user_id}/following - Obtener usuarios seguidos"""
-        limit = req.get_param_as_int('limit', default=100)
-        following = queries.get_user_following(self.db, user_id, limit)
-        following = convert_objectid_to_str(following)
-        
-        resp.media = {
-            'user_id': user_id,
-            'count': len(following),
-            'following': following
-        }
-        resp.status = falcon.HTTP_200
+        try:
+            limit = clamp_page_size(req.get_param_as_int('limit', default=100), default=100)
+            cursor = req.get_param('cursor')
+            following, next_cursor = await async_queries.get_user_following(self.db, user_id, limit, cursor)
+            
+            resp.media = {
+                'user_id': user_id,
+                'limit': limit,
+                'count': len(following),
+                'following': following,
+                'next_cursor': next_cursor
+            }
+            resp.status = falcon.HTTP_200
+        except Exception as e:
+            raise falcon.HTTPBadRequest(description=str(e))
+    
+    async def on_post(self, req, resp, user_id):
+        try:
+            data = await req.media
+            following_id = data.get('following_id')
+            
+            if not following_id:
+                raise falcon.HTTPBadRequest(description='following_id is required')
+            
+            followed = await async_queries.follow_user(self.db, user_id, following_id)
+            
+            if not followed:
+                resp.media = {'error': 'User already followed'}
+                resp.status = falcon.HTTP_409
+            else:
+                resp.media = {'success': True, 'message': 'User followed'}
+                resp.status = falcon.HTTP_201
+        except Exception as e:
+            raise falcon.HTTPBadRequest(description=str(e))
+    
+    async def on_delete(self, req, resp, user_id):
+        try:
+            following_id = req.get_param('following_id', required=True)
+            result = await async_queries.unfollow_user(self.db, user_id, following_id)
+            
+            if result.deleted_count > 0:
+                resp.media = {'success': True, 'message': 'User unfollowed'}
+                resp.status = falcon.HTTP_200
+            else:
+                resp.status = falcon.HTTP_404
+                resp.media = {'error': 'Relationship not found'}
+        except Exception as e:
+            raise falcon.HTTPBadRequest(description=str(e))
 
 #search_history
 class SearchHistoryResource:
@@ -307,8 +416,7 @@ class SearchHistoryResource:
     
     async def on_get(self, req, resp, user_id):
         limit = req.get_param_as_int('limit', default=10)
-        history = queries.get_search_history(self.db, user_id, limit)
-        history = convert_objectid_to_str(history)
+        history = await async_queries.get_search_history(self.db, user_id, limit)
         
         resp.media = {
             'user_id': user_id,
@@ -325,7 +433,7 @@ class SearchHistoryResource:
             if not searched_user_id:
                 raise falcon.HTTPBadRequest(description='searched_user_id is required')
             
-            queries.add_to_search_history(self.db, user_id, searched_user_id)
+            await async_queries.add_to_search_history(self.db, user_id, searched_user_id)
             
             resp.media = {'success': True, 'message': 'Added to search history'}
             resp.status = falcon.HTTP_201
@@ -340,8 +448,7 @@ class BestFriendsResource:
     
     async def on_get(self, req, resp, user_id):
         limit = req.get_param_as_int('limit', default=20)
-        best_friends = queries.get_best_friends(self.db, user_id, limit)
-        best_friends = convert_objectid_to_str(best_friends)
+        best_friends = await async_queries.get_best_friends(self.db, user_id, limit)
         
         resp.media = {
             'user_id': user_id,
@@ -358,7 +465,7 @@ class BestFriendsResource:
             if not friend_id:
                 raise falcon.HTTPBadRequest(description='friend_id is required')
             
-            inserted_id = queries.add_best_friend(self.db, user_id, friend_id)
+            inserted_id = await async_queries.add_best_friend(self.db, user_id, friend_id)
             
             if inserted_id is None:
                 resp.media = {'error': 'User already in best friends list'}
@@ -372,7 +479,7 @@ class BestFriendsResource:
     async def on_delete(self, req, resp, user_id):
         try:
             friend_id = req.get_param('friend_id', required=True)
-            result = queries.remove_best_friend(self.db, user_id, friend_id)
+            result = await async_queries.remove_best_friend(self.db, user_id, friend_id)
             
             if result.deleted_count > 0:
                 resp.media = {'success': True, 'message': 'Best friend removed'}
@@ -383,6 +490,35 @@ class BestFriendsResource:
         except Exception as e:
             raise falcon.HTTPBadRequest(description=str(e))
 
+class BestFriendsBulkResource:
+    
+    def __init__(self, db):
+        self.db = db
+    
+    async def on_post(self, req, resp, user_id):
+        items = await read_bulk_items(req)
+        friend_ids = [bulk_item_id(item, 'friend_id') for item in items]
+        
+        try:
+            results = await async_queries.bulk_add_best_friends(self.db, user_id, friend_ids)
+        except Exception as e:
+            raise falcon.HTTPBadRequest(description=str(e))
+        
+        resp.media = bulk_response(user_id, results)
+        resp.status = falcon.HTTP_200
+    
+    async def on_delete(self, req, resp, user_id):
+        items = await read_bulk_items(req)
+        friend_ids = [bulk_item_id(item, 'friend_id') for item in items]
+        
+        try:
+            results = await async_queries.bulk_remove_best_friends(self.db, user_id, friend_ids)
+        except Exception as e:
+            raise falcon.HTTPBadRequest(description=str(e))
+        
+        resp.media = bulk_response(user_id, results)
+        resp.status = falcon.HTTP_200
+
 #saved_post
 class SavedPostsResource:
     
@@ -391,8 +527,7 @@ class SavedPostsResource:
     
     async def on_get(self, req, resp, user_id):
         limit = req.get_param_as_int('limit', default=50)
-        saved_posts = queries.get_saved_posts(self.db, user_id, limit)
-        saved_posts = convert_objectid_to_str(saved_posts)
+        saved_posts = await async_queries.get_saved_posts(self.db, user_id, limit)
         
         resp.media = {
             'user_id': user_id,
@@ -410,7 +545,7 @@ class SavedPostsResource:
             if not post_id:
                 raise falcon.HTTPBadRequest(description='post_id is required')
             
-            inserted_id = queries.save_post(self.db, user_id, post_id, collection_name)
+            inserted_id = await async_queries.save_post(self.db, user_id, post_id, collection_name)
             
             if inserted_id is None:
                 resp.media = {'error': 'Post already saved'}
@@ -424,7 +559,7 @@ class SavedPostsResource:
     async def on_delete(self, req, resp, user_id):
         try:
             post_id = req.get_param('post_id', required=True)
-            result = queries.unsave_post(self.db, user_id, post_id)
+            result = await async_queries.unsave_post(self.db, user_id, post_id)
             
             if result.deleted_count > 0:
                 resp.media = {'success': True, 'message': 'Post unsaved'}
@@ -435,6 +570,41 @@ class SavedPostsResource:
         except Exception as e:
             raise falcon.HTTPBadRequest(description=str(e))
 
+class SavedPostsBulkResource:
+    
+    def __init__(self, db):
+        self.db = db
+    
+    async def on_post(self, req, resp, user_id):
+        items = await read_bulk_items(req)
+        entries = [
+            (
+                bulk_item_id(item, 'post_id'),
+                item.get('collection_name', 'Favoritos') if isinstance(item, dict) else 'Favoritos'
+            )
+            for item in items
+        ]
+        
+        try:
+            results = await async_queries.bulk_save_posts(self.db, user_id, entries)
+        except Exception as e:
+            raise falcon.HTTPBadRequest(description=str(e))
+        
+        resp.media = bulk_response(user_id, results)
+        resp.status = falcon.HTTP_200
+    
+    async def on_delete(self, req, resp, user_id):
+        items = await read_bulk_items(req)
+        post_ids = [bulk_item_id(item, 'post_id') for item in items]
+        
+        try:
+            results = await async_queries.bulk_unsave_posts(self.db, user_id, post_ids)
+        except Exception as e:
+            raise falcon.HTTPBadRequest(description=str(e))
+        
+        resp.media = bulk_response(user_id, results)
+        resp.status = falcon.HTTP_200
+
 #managing pipeline
 class ProfileSummaryResource:
 
@@ -442,12 +612,57 @@ class ProfileSummaryResource:
         self.db = db
     
     async def on_get(self, req, resp, user_id):
-        summary = queries.get_profile_summary(self.db, user_id)
+        try:
+            # stats: contadores mantenidos en users.stats; aggregate: recalcula con $lookup
+            source = req.get_param('source', default='stats')
+            summary = await async_queries.get_profile_summary(self.db, user_id, source)
+        except Exception as e:
+            raise falcon.HTTPBadRequest(description=str(e))
         
         if summary:
-            summary = convert_objectid_to_str(summary)
             resp.media = summary
             resp.status = falcon.HTTP_200
         else:
             resp.status = falcon.HTTP_404
             resp.media = {'error': 'User not found'}
+
+#cache
+class CacheStatsResource:
+
+    async def on_get(self, req, resp):
+        resp.media = {
+            'user_cache': queries.user_cache.stats()
+        }
+        resp.status = falcon.HTTP_200
+
+#query profiler
+class QueryProfilerResource:
+
+    def __init__(self, db):
+        self.db = db
+
+    async def on_get(self, req, resp):
+        # Configuracion compartida y estadisticas del worker que atiende el request
+        await async_queries.run_query(profiler.refresh_settings, self.db, True)
+        resp.media = {
+            'pid': os.getpid(),
+            'settings': profiler.settings,
+            'queries': profiler.stats()
+        }
+        resp.status = falcon.HTTP_200
+
+    async def on_put(self, req, resp):
+        try:
+            changes = await req.media
+            if not isinstance(changes, dict):
+                raise ValueError('Body must be an object with enabled, slow_ms and/or explain')
+            settings = await async_queries.run_query(profiler.update_settings, self.db, changes)
+        except Exception as e:
+            raise falcon.HTTPBadRequest(description=str(e))
+
+        resp.media = {'settings': settings}
+        resp.status = falcon.HTTP_200
+
+    async def on_delete(self, req, resp):
+        profiler.reset_stats()
+        resp.status = falcon.HTTP_204
@@ -0,0 +1,216 @@
+import gzip
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import bson
+from bson import json_util
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo import IndexModel
+
+from MongoDB.bulk_loader import DEFAULT_BATCH_SIZE, BulkLoader
+
+MANIFEST_FILE = 'manifest.json'
+# Documentos por archivo: cada parte se restaura en paralelo con las demas
+DEFAULT_PART_DOCS = 500000
+# Nivel 1: el cuello de botella es la CPU al comprimir, no el disco
+COMPRESS_LEVEL = 1
+# Colecciones de control de una carga que no tiene sentido restaurar
+SKIPPED_COLLECTIONS = ('load_checkpoints',)
+
+# Los documentos se copian como BSON crudo, sin decodificarlos a dict
+RAW_CODEC = CodecOptions(document_class=RawBSONDocument)
+
+# Fechas de actividad que se recorren al restaurar ('lista.campo' es un campo de cada elemento).
+# search_history y viral_leaderboard tienen TTL: sin recorrerlas, una copia vieja pierde
+# esos documentos al crear los indices, y las ventanas de /posts/viral quedan vacias
+DATE_FIELDS = {
+    'users': ('created_at',),
+    'posts': ('created_at', 'viral_detected_at'),
+    'viral_leaderboard': ('created_at',),
+    'user_relationships': ('followed_at',),
+    'best_friends': ('added_at',),
+    'saved_posts': ('saved_at',),
+    'search_history': ('updated_at', 'entries.searched_at'),
+}
+# Una copia de menos de esto se restaura con sus fechas originales
+MIN_SHIFT = timedelta(hours=1)
+
+
+def _part_path(directory, collection_name, part):
+    return os.path.join(directory, f"{collection_name}.{part:04d}.bson.gz")
+
+
+def _index_specs(collection):
+    specs = []
+    for index in collection.list_indexes():
+        if index['name'] == '_id_':
+            continue
+        options = {key: value for key, value in index.items() if key not in ('v', 'key', 'ns')}
+        specs.append({'key': list(index['key'].items()), 'options': options})
+    return specs
+
+
+def dump_collection(db, collection_name, directory, part_docs=DEFAULT_PART_DOCS):
+    collection = db.get_collection(collection_name, codec_options=RAW_CODEC)
+    started = time.time()
+    parts = []
+    documents = 0
+    part_file = None
+
+    try:
+        for document in collection.find({}, batch_size=10000):
+            if part_file is None or documents % part_docs == 0:
+                if part_file is not None:
+                    part_file.close()
+                path = _part_path(directory, collection_name, len(parts))
+                part_file = gzip.open(path, 'wb', compresslevel=COMPRESS_LEVEL)
+                parts.append(os.path.basename(path))
+            # Cada documento BSON empieza con su longitud, el archivo es una concatenacion
+            part_file.write(document.raw)
+            documents += 1
+    finally:
+        if part_file is not None:
+            part_file.close()
+
+    return {
+        'documents': documents,
+        'parts': parts,
+        'indexes': _index_specs(db[collection_name]),
+        'started': started,
+        'finished': time.time(),
+    }
+
+
+def dump(db, directory, collections=None, workers=4, part_docs=DEFAULT_PART_DOCS, log=print):
+    os.makedirs(directory, exist_ok=True)
+    infos = {info['name']: info for info in db.list_collections()}
+    names = [
+        name for name in (collections or sorted(infos))
+        if not name.startswith('system.') and name not in SKIPPED_COLLECTIONS and name in infos
+    ]
+
+    # Sin microsegundos: json_util guarda milisegundos
+    manifest = {'database': db.name, 'created_at': datetime.now().replace(microsecond=0), 'collections': {}}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(dump_collection, db, name, directory, part_docs): name
+            for name in names
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            result = future.result()
+            result['options'] = infos[name].get('options', {})
+            manifest['collections'][name] = result
+            log(f"dump   {name}: {result['documents']} docs in {len(result['parts'])} files")
+
+    with open(os.path.join(directory, MANIFEST_FILE), 'w') as f:
+        f.write(json_util.dumps(manifest, indent=2))
+
+    # (coleccion, documentos, inicio, fin), como espera print_throughput
+    return [
+        (name, info['documents'], info['started'], info['finished'])
+        for name, info in manifest['collections'].items()
+    ]
+
+
+def read_raw_documents(path):
+    """Recorre un archivo de la snapshot regresando RawBSONDocument sin decodificarlos."""
+    with gzip.open(path, 'rb') as f:
+        while True:
+            header = f.read(4)
+            if not header:
+                return
+            size = struct.unpack('<i', header)[0]
+            yield RawBSONDocument(header + f.read(size - 4))
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        return json_util.loads(f.read())
+
+
+def _shift_fields(document, fields, shift):
+    for field in fields:
+        name, _, subfield = field.partition('.')
+        value = document.get(name)
+        if subfield:
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict) and isinstance(item.get(subfield), datetime):
+                        item[subfield] += shift
+        # Un campo ausente, null o que no es fecha (un created_at guardado como texto) se queda igual
+        elif isinstance(value, datetime):
+            document[name] = value + shift
+    return document
+
+
+def shifted_documents(documents, fields, shift):
+    """Decodifica cada RawBSONDocument y recorre sus fechas mientras se cargan, sin otra pasada."""
+    for document in documents:
+        yield _shift_fields(bson.decode(document.raw), fields, shift)
+
+
+def restore(db, directory, collections=None, workers=4, batch_size=DEFAULT_BATCH_SIZE, writers=2,
+            keep_dates=False, log=print):
+    """Regresa (coleccion, documentos, inicio, fin) por archivo cargado.
+
+    Salvo keep_dates, las fechas se recorren lo que tenga de antiguedad la copia: el
+    dataset queda como si se hubiera generado al restaurarlo.
+    """
+    manifest = read_manifest(directory)
+    names = [name for name in (collections or manifest['collections']) if name in manifest['collections']]
+
+    # drop + create con las mismas opciones; los indices se construyen al final
+    for name in names:
+        db.drop_collection(name)
+        db.create_collection(name, **manifest['collections'][name].get('options', {}))
+
+    shift = datetime.now() - manifest['created_at']
+    shift = timedelta(seconds=int(shift.total_seconds())) if not keep_dates and shift >= MIN_SHIFT else None
+    for name in names:
+        if shift and name in DATE_FIELDS:
+            log(f"dates  {name}: +{shift}")
+
+    def documents(name, path):
+        # Solo las colecciones con fechas que recorrer se decodifican; las demas van como BSON crudo
+        raw = read_raw_documents(path)
+        if shift and name in DATE_FIELDS:
+            return shifted_documents(raw, DATE_FIELDS[name], shift)
+        return raw
+
+    # Una tarea por archivo: las colecciones grandes se reparten en varios threads
+    loader = BulkLoader(db, batch_size, writers)
+    parts = [
+        (name, os.path.join(directory, part))
+        for name in names
+        for part in manifest['collections'][name]['parts']
+    ]
+    tasks = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(loader.write, name, documents(name, path)): (name, path)
+            for name, path in parts
+        }
+        for future in as_completed(futures):
+            name, path = futures[future]
+            inserted, started, finished = future.result()
+            tasks.append((name, inserted, started, finished))
+            log(f"load   {name}: {inserted} docs from {os.path.basename(path)}")
+
+    for name in names:
+        specs = manifest['collections'][name]['indexes']
+        if specs:
+            log(f"index  {name}: {', '.join(spec['options']['name'] for spec in specs)}")
+            db[name].create_indexes([IndexModel(spec['key'], **spec['options']) for spec in specs])
+
+    for name in names:
+        expected = manifest['collections'][name]['documents']
+        actual = db[name].estimated_document_count()
+        if actual != expected:
+            raise RuntimeError(f"{name}: restored {actual} documents, snapshot has {expected}")
+
+    return tasks
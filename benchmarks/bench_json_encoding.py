@@ -0,0 +1,107 @@
+"""Costo por documento de serializar respuestas de MongoDB a JSON.
+
+before: convert_objectid_to_str (recorre y muta el documento) + json.dumps de Falcon
+after:  MongoDB.json_handler.dumps (una sola pasada, sin mutar)
+
+    python3 benchmarks/bench_json_encoding.py --docs 1000 --runs 20
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from MongoDB.json_handler import dumps
+
+
+# Implementacion anterior de MongoDB/resources.py, se conserva como referencia
+def convert_objectid_to_str(doc):
+    if doc is None:
+        return None
+
+    if isinstance(doc, list):
+        return [convert_objectid_to_str(item) for item in doc]
+
+    if isinstance(doc, dict):
+        for key, value in doc.items():
+            if isinstance(value, ObjectId):
+                doc[key] = str(value)
+            elif isinstance(value, datetime):
+                doc[key] = value.isoformat()
+            elif isinstance(value, dict):
+                doc[key] = convert_objectid_to_str(value)
+            elif isinstance(value, list):
+                doc[key] = [convert_objectid_to_str(item) if isinstance(item, (dict, ObjectId)) else item for item in value]
+        return doc
+
+    if isinstance(doc, ObjectId):
+        return str(doc)
+
+    return doc
+
+
+def legacy_dumps(media):
+    return json.dumps(convert_objectid_to_str(media), ensure_ascii=False).encode('utf-8')
+
+
+def make_post(now):
+    return {
+        '_id': ObjectId(),
+        'user_id': ObjectId(),
+        'description': 'Post de prueba para medir la serializacion ' * 4,
+        'created_at': now - timedelta(minutes=random.randint(0, 100000)),
+        'location': random.choice(['Guadalajara', 'Zapopan', 'Tlaquepaque', 'Tonalá']),
+        'hashtags': random.sample(['MongoDB', 'Tech', 'Coding', 'ITESO', 'Python'], k=3),
+        'tagged_users': [ObjectId() for _ in range(random.randint(0, 3))],
+        'likes_count': random.randint(0, 150),
+        'comments_count': random.randint(0, 80),
+        'is_viral': True,
+        'viral_detected_at': now,
+        'user_info': {
+            'username': 'usuario123',
+            'personal_info': {'first_name': 'Ana', 'last_name': 'López'}
+        }
+    }
+
+
+def bench(encode, payloads):
+    start = time.perf_counter()
+    for payload in payloads:
+        encode(payload)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=1000, help='documentos por respuesta')
+    parser.add_argument('--runs', type=int, default=20, help='respuestas serializadas por implementacion')
+    args = parser.parse_args()
+
+    random.seed(42)
+    now = datetime.now()
+    template = {'count': args.docs, 'posts': [make_post(now) for _ in range(args.docs)]}
+
+    # convert_objectid_to_str muta el documento, cada corrida necesita su copia
+    before_payloads = [copy.deepcopy(template) for _ in range(args.runs)]
+    after_payloads = [template] * args.runs
+
+    assert json.loads(legacy_dumps(copy.deepcopy(template))) == json.loads(dumps(template))
+
+    before = bench(legacy_dumps, before_payloads)
+    after = bench(dumps, after_payloads)
+
+    total_docs = args.docs * args.runs
+    print(f"documents: {total_docs}")
+    print(f"before: {before / total_docs * 1e6:.2f} us/doc")
+    print(f"after:  {after / total_docs * 1e6:.2f} us/doc")
+    print(f"speedup: {before / after:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
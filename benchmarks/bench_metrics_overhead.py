@@ -0,0 +1,87 @@
+"""Costo por request de MetricsMiddleware.
+
+Mide dos cosas: los tres hooks del middleware llamados directamente sobre el mismo
+request (costo aislado), y la misma ruta trivial servida con y sin el middleware
+dentro de un solo event loop (ASGIConductor, sin red). La segunda incluye el ruido
+del resto de Falcon, por eso se alternan varias rondas y se reporta la mediana.
+
+    python3 benchmarks/bench_metrics_overhead.py --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import falcon.asgi
+import falcon.testing
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metrics
+from MongoDB.json_handler import create_json_handler
+
+
+class ItemResource:
+    async def on_get(self, req, resp, item_id):
+        resp.media = {'_id': item_id, 'username': 'bench_user', 'stats': {'posts_count': 10}}
+
+
+def build_app(with_metrics):
+    middleware = [metrics.MetricsMiddleware(metrics.MetricsRegistry())] if with_metrics else []
+    app = falcon.asgi.App(middleware=middleware)
+    json_handler = create_json_handler()
+    app.resp_options.media_handlers[falcon.MEDIA_JSON] = json_handler
+    app.add_route('/items/{item_id}', ItemResource())
+    return app
+
+
+async def measure(app, requests):
+    async with falcon.testing.ASGIConductor(app) as conductor:
+        start = time.perf_counter()
+        for i in range(requests):
+            await conductor.simulate_get(f'/items/{i % 100}')
+        return (time.perf_counter() - start) / requests
+
+
+async def measure_hooks(requests):
+    middleware = metrics.MetricsMiddleware(metrics.MetricsRegistry())
+    req = falcon.testing.create_asgi_req(path='/items/1')
+    req.uri_template = '/items/{item_id}'
+    resp = falcon.asgi.Response()
+    # Cuerpo ya serializado: el costo de serializar existe con o sin metricas
+    resp.text = '{"_id":"1"}'
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await middleware.process_request(req, resp)
+        await middleware.process_resource(req, resp, None, {})
+        await middleware.process_response(req, resp, None, True)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    hooks_us = statistics.median(asyncio.run(measure_hooks(args.requests)) for _ in range(args.rounds)) * 1e6
+
+    plain, instrumented = [], []
+    # Se alternan las corridas para que el ruido del sistema afecte a ambas por igual
+    for _ in range(args.rounds):
+        plain.append(asyncio.run(measure(build_app(False), args.requests)))
+        instrumented.append(asyncio.run(measure(build_app(True), args.requests)))
+
+    plain_us = statistics.median(plain) * 1e6
+    instrumented_us = statistics.median(instrumented) * 1e6
+    print(f"requests per round: {args.requests}, rounds: {args.rounds}")
+    print(f"middleware hooks: {hooks_us:.1f} us/request")
+    print(f"without metrics:  {plain_us:.1f} us/request")
+    print(f"with metrics:     {instrumented_us:.1f} us/request")
+    print(f"overhead:         {instrumented_us - plain_us:.1f} us/request ({(instrumented_us / plain_us - 1) * 100:.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,374 @@
+"""Latencia y documentos examinados de cada funcion de lectura de MongoDB/queries.py.
+
+Carga un dataset con los generadores de populate.py --scale y semilla fija en una base aparte
+(social_network_bench por defecto) y mide cada funcion con usuarios ligeros y pesados (con
+--profile skewed, los autores mas y menos activos). Por cada caso reporta la
+distribucion de latencia, y con explain (executionStats) de los comandos que mando la
+funcion: documentos y llaves examinados contra documentos regresados e indices usados.
+
+    python3 benchmarks/bench_queries.py --users 10000 --output bench.json
+    python3 benchmarks/bench_queries.py --users 10000 --baseline bench.json
+    python3 benchmarks/bench_queries.py --functions get_saved_posts,get_profile_summary
+
+El dataset se reutiliza mientras --users, --seed y --profile no cambien y tenga menos de
+MAX_DATASET_AGE_DAYS dias (--reseed para regenerarlo).
+Necesita un mongod local; el tamano razonable va de 10k a 10M usuarios.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from connect import get_mongo_db
+from MongoDB import queries
+from MongoDB.bulk_loader import BulkLoader
+from MongoDB.instrumentation import EXPLAINABLE_COMMANDS, count_documents, profiler
+from MongoDB.migrations import sync_indexes
+from populate import LOADED_COLLECTIONS, PROFILES, SCALE_CHUNK_USERS, SCALE_COLLECTIONS, scale_chunk, user_oid
+
+# search_history llega hasta 60 dias atras y el TTL de sync_indexes es de 90: un dataset
+# mas viejo empieza a perder historial, asi que se vuelve a generar
+MAX_DATASET_AGE_DAYS = 30
+POSTS_PER_USER = 5
+
+
+# Dataset
+
+def dataset_config(users, seed, profile, now):
+    # Misma forma que la config de populate.py --scale: mismos documentos para la misma semilla
+    return {
+        'users': users,
+        'seed': seed,
+        'profile': profile,
+        'posts_per_user': POSTS_PER_USER,
+        'chunk_users': SCALE_CHUNK_USERS,
+        'now': now,
+    }
+
+
+def seed_dataset(db, users, seed, profile):
+    loader = BulkLoader(db)
+    loader.reset_collections(LOADED_COLLECTIONS)
+
+    # Las fechas van hacia atras desde el momento de generar, para caer dentro del TTL de
+    # search_history y de la ventana de get_viral_posts; se guarda para armar los casos
+    now = datetime.now().replace(microsecond=0)
+    config = dataset_config(users, seed, profile, now)
+    chunks = range((users + SCALE_CHUNK_USERS - 1) // SCALE_CHUNK_USERS)
+
+    counts = {}
+    started = time.perf_counter()
+    for name in SCALE_COLLECTIONS:
+        counts[name] = sum(loader.write(name, scale_chunk(name, chunk, config))[0] for chunk in chunks)
+
+    queries.rebuild_viral_leaderboard(db)
+    queries.recompute_user_stats(db)
+    sync_indexes(db, log=lambda message: None)
+
+    meta = {'_id': 'dataset', 'users': users, 'seed': seed, 'profile': profile, 'now': now, 'counts': counts,
+            'seed_seconds': round(time.perf_counter() - started, 1)}
+    db.bench_meta.replace_one({'_id': 'dataset'}, meta, upsert=True)
+    return meta
+
+
+# Casos
+
+def sample_users(db, meta, heavy, count):
+    """Usuarios ligeros o pesados, siempre los mismos para el mismo dataset.
+
+    Pesados son los autores mas activos del perfil skewed (los que concentran posts); el
+    perfil uniform no tiene pesados. Los ligeros son la cola del ranking, o en uniform
+    usuarios repartidos en todo el rango de ids.
+    """
+    users = meta['users']
+    profile = PROFILES[meta['profile']](users, meta['seed'], POSTS_PER_USER, meta['now'])
+    ranking = getattr(profile, 'activity', None)
+    count = min(count, users)
+
+    if ranking is not None:
+        ranks = range(count) if heavy else range(users - 1, users - 1 - count, -1)
+        numbers = [ranking.user(rank) for rank in ranks]
+    elif heavy:
+        return []
+    else:
+        numbers = list(range(0, users, max(1, users // count)))[:count]
+
+    found = {
+        user['_id']: user
+        for user in db.users.find(
+            {'_id': {'$in': [user_oid(n) for n in numbers]}}, {'username': 1, 'personal_info.location': 1}
+        )
+    }
+    return [
+        {
+            '_id': str(user['_id']),
+            'username': user['username'],
+            'city': user['personal_info']['location'].split(',')[0]
+        }
+        for user in (found.get(user_oid(n)) for n in numbers)
+        if user is not None
+    ]
+
+
+def build_cases(now):
+    """nombre -> (funcion(db, usuario, todos_los_usuarios), depende_del_usuario).
+
+    now es el momento en que se genero el dataset; las ventanas de fechas parten de ahi.
+    """
+    return {
+        'get_user_by_id': (lambda db, u, _: queries.get_user_by_id(db, u['_id']), True),
+        'get_user_by_username': (lambda db, u, _: queries.get_user_by_username(db, u['username']), True),
+        'get_users_by_location': (lambda db, u, _: queries.get_users_by_location(db, u['city'], 20), True),
+        'get_users_by_location[regex]': (
+            lambda db, u, _: queries.get_users_by_location(db, u['city'], 20, mode='regex'), True
+        ),
+        'get_user_cards_by_ids': (
+            lambda db, u, sample: queries.get_user_cards_by_ids(db, [other['_id'] for other in sample]), False
+        ),
+        'get_posts_by_date_range': (
+            lambda db, u, _: queries.get_posts_by_date_range(db, u['_id'], now - timedelta(days=365), now, 20), True
+        ),
+        'get_viral_posts': (lambda db, u, _: queries.get_viral_posts(db, 30, queries.VIRAL_MIN_LIKES, 50), False),
+        'get_user_following': (lambda db, u, _: queries.get_user_following(db, u['_id'], 100), True),
+        'get_search_history': (lambda db, u, _: queries.get_search_history(db, u['_id']), True),
+        'get_best_friends': (lambda db, u, _: queries.get_best_friends(db, u['_id']), True),
+        'get_saved_posts': (lambda db, u, _: queries.get_saved_posts(db, u['_id']), True),
+        'get_profile_summary': (lambda db, u, _: queries.get_profile_summary(db, u['_id']), True),
+        'get_profile_summary[aggregate]': (
+            lambda db, u, _: queries.get_profile_summary(db, u['_id'], source='aggregate'), True
+        ),
+        'get_user_privacy_settings': (lambda db, u, _: queries.get_user_privacy_settings(db, u['_id']), True),
+        'get_notification_preferences': (lambda db, u, _: queries.get_notification_preferences(db, u['_id']), True),
+    }
+
+
+# Explain
+
+def walk(node):
+    yield node
+    if isinstance(node, dict):
+        for value in node.values():
+            yield from walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from walk(value)
+
+
+def explain_call(db, call, user, sample):
+    """Ejecuta la funcion capturando sus comandos y explica cada uno con executionStats."""
+    queries.user_cache.clear()
+    with profiler.capture() as commands:
+        result = call(db, user, sample)
+
+    totals = {'docs_examined': 0, 'keys_examined': 0, 'returned': count_documents(result), 'commands': len(commands)}
+    indexes = set()
+    collscan = False
+
+    for command_name, command in commands:
+        if command_name not in EXPLAINABLE_COMMANDS:
+            continue
+        explain = db.command({'explain': command, 'verbosity': 'executionStats'})
+        for node in walk(explain):
+            if not isinstance(node, dict):
+                continue
+            totals['docs_examined'] += node.get('totalDocsExamined', 0) or 0
+            totals['keys_examined'] += node.get('totalKeysExamined', 0) or 0
+            for stage in walk(node.get('winningPlan')):
+                if isinstance(stage, dict):
+                    if stage.get('indexName'):
+                        indexes.add(stage['indexName'])
+                    collscan = collscan or stage.get('stage') == 'COLLSCAN'
+            indexes.update(node.get('indexesUsed') or [])
+
+    return totals, indexes, collscan
+
+
+# Medicion
+
+def percentile(sorted_values, p):
+    rank = max(1, -(-p * len(sorted_values) // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def measure_case(db, call, sample, iterations, warmup, explain_users):
+    for i in range(warmup):
+        queries.user_cache.clear()
+        call(db, sample[i % len(sample)], sample)
+
+    samples = []
+    for i in range(iterations):
+        user = sample[i % len(sample)]
+        # Sin cache: se mide la query, no el LRU
+        queries.user_cache.clear()
+        started = time.perf_counter()
+        call(db, user, sample)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+
+    explained = [explain_call(db, call, user, sample) for user in sample[:explain_users]]
+    docs_examined = statistics.mean(totals['docs_examined'] for totals, _, _ in explained)
+    keys_examined = statistics.mean(totals['keys_examined'] for totals, _, _ in explained)
+    returned = statistics.mean(totals['returned'] for totals, _, _ in explained)
+
+    return {
+        'iterations': iterations,
+        'min_ms': round(samples[0], 3),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'max_ms': round(samples[-1], 3),
+        'mean_ms': round(statistics.mean(samples), 3),
+        'docs_examined': round(docs_examined, 1),
+        'keys_examined': round(keys_examined, 1),
+        'returned': round(returned, 1),
+        'examined_per_returned': round(docs_examined / returned, 2) if returned else None,
+        'indexes': sorted(set().union(*(indexes for _, indexes, _ in explained))),
+        'collscan': any(collscan for _, _, collscan in explained),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Regresa las lineas de diferencia y si hubo alguna regresion."""
+    lines = []
+    regressed = False
+    base_results = baseline.get('results', {})
+
+    for case, classes in results.items():
+        for user_class, stats in classes.items():
+            base = base_results.get(case, {}).get(user_class)
+            if not base:
+                lines.append(f"{case:<34}{user_class:<7} new")
+                continue
+
+            flags = []
+            for key in ('p50_ms', 'p99_ms'):
+                change = (stats[key] / base[key] - 1) * 100 if base[key] else 0
+                # Se ignoran cambios de menos de medio milisegundo, son ruido
+                if change > threshold and stats[key] - base[key] > 0.5:
+                    flags.append(f"{key} +{change:.0f}%")
+            if base['docs_examined'] and (stats['docs_examined'] / base['docs_examined'] - 1) * 100 > threshold:
+                flags.append(f"docs_examined {base['docs_examined']} -> {stats['docs_examined']}")
+            if stats['collscan'] and not base['collscan']:
+                flags.append("now COLLSCAN")
+
+            regressed = regressed or bool(flags)
+            lines.append(
+                f"{case:<34}{user_class:<7}"
+                f"p50 {base['p50_ms']:>8.2f} -> {stats['p50_ms']:>8.2f}  "
+                f"p99 {base['p99_ms']:>8.2f} -> {stats['p99_ms']:>8.2f}  "
+                f"examined {base['docs_examined']:>9} -> {stats['docs_examined']:>9}"
+                + (f"  REGRESSION: {', '.join(flags)}" if flags else "")
+            )
+
+    return lines, regressed
+
+
+def print_results(results):
+    header = (
+        f"{'function':<34}{'users':<7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+        f"{'examined':>10}{'returned':>10}  indexes"
+    )
+    print(header)
+    print('-' * len(header))
+    for case, classes in results.items():
+        for user_class, stats in classes.items():
+            indexes = ', '.join(stats['indexes']) or '-'
+            if stats['collscan']:
+                indexes += ' + COLLSCAN'
+            print(
+                f"{case:<34}{user_class:<7}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+                f"{stats['max_ms']:>9.2f}{stats['docs_examined']:>10}{stats['returned']:>10}  {indexes}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='social_network_bench')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='skewed',
+                        help='populate.py distribution; uniform has no heavy users')
+    parser.add_argument('--reseed', action='store_true', help='regenerate the dataset even if it matches')
+    parser.add_argument('--iterations', type=int, default=50, help='timed calls per function and user class')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--sample-users', type=int, default=20, help='users per class (light/heavy)')
+    parser.add_argument('--explain-users', type=int, default=3, help='users per class explained with executionStats')
+    parser.add_argument('--functions', help='comma separated subset of cases')
+    parser.add_argument('--output', help='write the JSON results here (use it as a future --baseline)')
+    parser.add_argument('--baseline', help='previous --output file to diff against')
+    parser.add_argument('--threshold', type=float, default=20, help='percent change reported as regression')
+    args = parser.parse_args()
+
+    if args.database == 'social_network' or args.users < 2:
+        parser.error("use a dedicated database (the dataset drops its collections) and at least 2 users")
+
+    db = get_mongo_db().client[args.database]
+
+    meta = db.bench_meta.find_one({'_id': 'dataset'})
+    stale = not meta or 'now' not in meta or datetime.now() - meta['now'] > timedelta(days=MAX_DATASET_AGE_DAYS)
+    if (args.reseed or stale or meta['users'] != args.users or meta['seed'] != args.seed
+            or meta.get('profile') != args.profile):
+        print(f"Seeding {args.users} users into {args.database} (seed {args.seed}, {args.profile}) ...")
+        meta = seed_dataset(db, args.users, args.seed, args.profile)
+    print(f"Dataset: {meta['counts']} (seeded in {meta['seed_seconds']} s)")
+
+    cases = build_cases(meta['now'])
+    if args.functions:
+        selected = args.functions.split(',')
+        unknown = set(selected) - set(cases)
+        if unknown:
+            parser.error(f"unknown functions: {', '.join(sorted(unknown))}; available: {', '.join(cases)}")
+        cases = {name: cases[name] for name in selected}
+
+    samples = {
+        'light': sample_users(db, meta, heavy=False, count=args.sample_users),
+        'heavy': sample_users(db, meta, heavy=True, count=args.sample_users),
+    }
+
+    results = {}
+    for name, (call, per_user) in cases.items():
+        # Las funciones que no dependen del usuario se miden una sola vez
+        classes = samples if per_user else {'all': samples['light']}
+        results[name] = {
+            user_class: measure_case(db, call, sample, args.iterations, args.warmup, args.explain_users)
+            for user_class, sample in classes.items()
+            if sample
+        }
+
+    print()
+    print_results(results)
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'dataset': {
+            'database': args.database, 'users': meta['users'], 'seed': meta['seed'], 'profile': meta['profile'],
+            'seeded_at': meta['now'].isoformat(), 'counts': meta['counts']
+        },
+        'config': {'iterations': args.iterations, 'warmup': args.warmup, 'sample_users': args.sample_users},
+        'results': results,
+    }
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('dataset', {}).get('users') != meta['users']:
+            print("\nWARNING: baseline was measured on a different dataset size")
+        lines, regressed = compare(results, baseline, args.threshold)
+        print(f"\nAgainst {args.baseline} (threshold {args.threshold}%):")
+        print('\n'.join(lines))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Tiempo que tarda un worker en importar main:app (lo que paga cada reinicio).
+
+Cada corrida es un proceso nuevo para no reutilizar modulos ya importados.
+
+    python3 benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_once():
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, '-c', 'import main'],
+        cwd=ROOT,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    # La primera corrida compila los .pyc, no se cuenta
+    measure_once()
+    samples = [measure_once() for _ in range(args.runs)]
+
+    print(f"runs: {args.runs}")
+    print(f"median: {statistics.median(samples) * 1000:.1f} ms")
+    print(f"max:    {max(samples) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
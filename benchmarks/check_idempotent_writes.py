@@ -0,0 +1,106 @@
+"""Revisa que las escrituras idempotentes aguanten muchas llamadas concurrentes con el mismo par.
+
+save_post, add_best_friend y follow_user se llaman --tasks veces a la vez por ronda: exactamente
+una llamada debe reportar el insert, la coleccion debe terminar con un solo documento y cada
+contador de users.stats debe subir exactamente 1. Sale con codigo 1 si algo falla. Crea
+usuarios temporales; necesita MongoDB con los indices unicos (python3 migrate.py).
+
+    python3 benchmarks/check_idempotent_writes.py --tasks 200 --rounds 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+from bson.objectid import ObjectId
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from connect import get_mongo_db
+from MongoDB import async_queries
+
+
+async def hammer(write, tasks):
+    """Regresa cuantas de las llamadas concurrentes reportaron el insert."""
+    results = await asyncio.gather(*(write() for _ in range(tasks)))
+    # save_post/add_best_friend regresan el id insertado o None, follow_user True/False
+    return sum(1 for result in results if result is not None and result is not False)
+
+
+def stats(db, user_id):
+    return db.users.find_one({'_id': user_id}).get('stats', {})
+
+
+def check(failures, name, actual, expected):
+    ok = actual == expected
+    if not ok:
+        failures.append(f"{name}: expected {expected}, got {actual}")
+    return f"{name}={actual}"
+
+
+async def run(db, tasks, rounds):
+    failed_rounds = 0
+
+    for round_number in range(1, rounds + 1):
+        user_id = ObjectId()
+        target_id = ObjectId()
+        db.users.insert_many([
+            {'_id': user_id, 'username': f'stress_{user_id}', 'email': f'{user_id}@stress.test'},
+            {'_id': target_id, 'username': f'stress_{target_id}', 'email': f'{target_id}@stress.test'},
+        ])
+
+        failures = []
+        try:
+            user_before = stats(db, user_id)
+            target_before = stats(db, target_id)
+
+            saved = await hammer(lambda: async_queries.save_post(db, str(user_id), str(target_id)), tasks)
+            friends = await hammer(lambda: async_queries.add_best_friend(db, str(user_id), str(target_id)), tasks)
+            follows = await hammer(lambda: async_queries.follow_user(db, str(user_id), str(target_id)), tasks)
+
+            user_after = stats(db, user_id)
+            target_after = stats(db, target_id)
+
+            def delta(before, after, field):
+                return after.get(field, 0) - before.get(field, 0)
+
+            report = [
+                check(failures, 'save_post inserted', saved, 1),
+                check(failures, 'saved_posts docs',
+                      db.saved_posts.count_documents({'user_id': user_id, 'post_id': target_id}), 1),
+                check(failures, 'saved_posts_count delta', delta(user_before, user_after, 'saved_posts_count'), 1),
+                check(failures, 'add_best_friend inserted', friends, 1),
+                check(failures, 'best_friends docs',
+                      db.best_friends.count_documents({'user_id': user_id, 'friend_id': target_id}), 1),
+                check(failures, 'follow_user followed', follows, 1),
+                check(failures, 'user_relationships docs', db.user_relationships.count_documents(
+                    {'follower_id': user_id, 'following_id': target_id, 'status': 'active'}), 1),
+                check(failures, 'following_count delta', delta(user_before, user_after, 'following_count'), 1),
+                check(failures, 'followers_count delta', delta(target_before, target_after, 'followers_count'), 1),
+            ]
+            print(f"round {round_number}: {' '.join(report)} -> {'OK' if not failures else 'FAIL'}")
+            for failure in failures:
+                print(f"  FAIL {failure}")
+        finally:
+            db.saved_posts.delete_many({'user_id': user_id})
+            db.best_friends.delete_many({'user_id': user_id})
+            db.user_relationships.delete_many({'follower_id': user_id})
+            db.users.delete_many({'_id': {'$in': [user_id, target_id]}})
+
+        failed_rounds += bool(failures)
+
+    return failed_rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=200, help='llamadas concurrentes sobre el mismo par')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    failed_rounds = asyncio.run(run(get_mongo_db(), args.tasks, args.rounds))
+    async_queries.shutdown_executor()
+    sys.exit(1 if failed_rounds else 0)
+
+
+if __name__ == '__main__':
+    main()
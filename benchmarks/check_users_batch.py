@@ -0,0 +1,80 @@
+"""Revisa las formas de query string que acepta GET /mongo/users/batch.
+
+?ids=a,b,c, ?ids=a&ids=b y ?usernames=x,y deben encontrar a los mismos usuarios, en el
+orden pedido y sin reportarlos como faltantes. Crea usuarios temporales; necesita MongoDB.
+
+    python3 benchmarks/check_users_batch.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+import falcon
+import falcon.asgi
+import falcon.testing
+from bson.objectid import ObjectId
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from connect import get_mongo_db
+from MongoDB import async_queries, resources
+from MongoDB.json_handler import create_json_handler
+
+
+def build_app(db):
+    app = falcon.asgi.App()
+    json_handler = create_json_handler()
+    app.resp_options.media_handlers[falcon.MEDIA_JSON] = json_handler
+    app.add_route('/mongo/users/batch', resources.UsersBatchResource(db))
+    return app
+
+
+async def run(db, users):
+    user_ids = [ObjectId() for _ in range(users)]
+    db.users.insert_many([
+        {'_id': user_id, 'username': f'batch_check_{user_id}', 'email': f'{user_id}@batch.test'}
+        for user_id in user_ids
+    ])
+    ids = [str(user_id) for user_id in reversed(user_ids)]
+    usernames = [f'batch_check_{user_id}' for user_id in reversed(user_ids)]
+    missing_id = str(ObjectId())
+
+    cases = {
+        'ids=a,b,c': {'ids': ','.join(ids)},
+        'ids=a&ids=b': {'ids': ids},
+        'ids=a,b&ids=c': {'ids': [','.join(ids[:-1]), ids[-1]]},
+        'usernames=x,y': {'usernames': ','.join(usernames)},
+    }
+
+    failures = 0
+    try:
+        async with falcon.testing.ASGIConductor(build_app(db)) as conductor:
+            for name, params in cases.items():
+                result = await conductor.simulate_get('/mongo/users/batch', params=params)
+                found = [user['_id'] for user in result.json.get('users', [])]
+                ok = result.status_code == 200 and found == ids and result.json['missing'] == []
+                failures += not ok
+                print(f"{name}: status={result.status_code} found={len(found)} missing={result.json.get('missing')} -> {'OK' if ok else 'FAIL'}")
+
+            result = await conductor.simulate_get('/mongo/users/batch', params={'ids': f"{ids[0]},{missing_id}"})
+            ok = result.status_code == 200 and result.json['missing'] == [missing_id]
+            failures += not ok
+            print(f"ids=found,missing: missing={result.json.get('missing')} -> {'OK' if ok else 'FAIL'}")
+    finally:
+        db.users.delete_many({'_id': {'$in': user_ids}})
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=3, help='usuarios temporales por caso')
+    args = parser.parse_args()
+
+    failures = asyncio.run(run(get_mongo_db(), args.users))
+    async_queries.shutdown_executor()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,14 @@
 import argparse
 import logging
 import os
+import random
 import requests
 import json
 import sys
+import threading
+import time
 from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
 
 API_BASE_URL = os.getenv("PROJECT_BDNR_API_URL", "http://localhost:8000")
 
@@ -278,5 +282,338 @@ def main():
         else:
             print("Please enter a valid option")
 
+# LOAD TEST
+# Modo no interactivo: python3 client.py --load --concurrency 32 --duration 60 --output load.json
+
+# Escenario -> peso por defecto. Las escrituras quedan en 0 para no modificar datos sin pedirlo.
+LOAD_SCENARIOS = {
+    'user': 15,
+    'user_by_username': 10,
+    'users_batch': 5,
+    'location': 10,
+    'viral': 10,
+    'posts_by_date': 10,
+    'summary': 10,
+    'best_friends': 8,
+    'saved_posts': 8,
+    'following': 8,
+    'search_history': 6,
+    'follow_unfollow': 0,
+    'save_unsave': 0,
+}
+
+LOAD_PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(text):
+    """'user=20,viral=5' -> pesos; los escenarios que no aparecen conservan su peso por defecto."""
+    mix = dict(LOAD_SCENARIOS)
+    if not text:
+        return mix
+
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in LOAD_SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}, use: {', '.join(LOAD_SCENARIOS)}")
+        mix[name] = float(weight)
+
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("At least one scenario needs a positive weight")
+    return mix
+
+
+def new_session(pool_size=1):
+    # Una sesion por thread: reutiliza la conexion keep-alive en cada request
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def discover_targets(base_url, locations, sample_size):
+    """Obtiene ids y usernames reales de la API para usarlos en los escenarios."""
+    session = new_session()
+    users = {}
+
+    for location in locations:
+        response = session.get(
+            f"{base_url}/mongo/users/location",
+            params={'location': location, 'limit': sample_size},
+            timeout=30
+        )
+        response.raise_for_status()
+        for user in response.json()['users']:
+            users[user['_id']] = user
+        if len(users) >= sample_size:
+            break
+
+    response = session.get(f"{base_url}/mongo/posts/viral", params={'days': 30, 'min_likes': 0, 'limit': 100}, timeout=30)
+    response.raise_for_status()
+    post_ids = [post['_id'] for post in response.json()['posts']]
+
+    if len(users) < 2:
+        raise RuntimeError("Need at least 2 users to run the load test, run populate.py first")
+
+    cities = sorted({
+        (user.get('personal_info') or {}).get('location', '').split(',')[0].strip()
+        for user in users.values()
+    } - {''})
+
+    return {
+        'user_ids': list(users),
+        'usernames': [user['username'] for user in users.values()],
+        'cities': cities or list(locations),
+        'post_ids': post_ids,
+    }
+
+
+def build_request(name, targets, rng):
+    """Regresa una lista de (metodo, ruta, kwargs); los escenarios de escritura hacen dos requests.
+
+    El DELETE solo se manda si el POST creo el par (201), ver load_worker.
+    """
+    user_id = rng.choice(targets['user_ids'])
+
+    if name == 'user':
+        return [('GET', f"/mongo/users/{user_id}", {})]
+    if name == 'user_by_username':
+        return [('GET', "/mongo/users", {'params': {'username': rng.choice(targets['usernames'])}})]
+    if name == 'users_batch':
+        ids = rng.sample(targets['user_ids'], min(20, len(targets['user_ids'])))
+        return [('GET', "/mongo/users/batch", {'params': {'ids': ','.join(ids)}})]
+    if name == 'location':
+        return [('GET', "/mongo/users/location", {'params': {'location': rng.choice(targets['cities']), 'limit': 20}})]
+    if name == 'viral':
+        return [('GET', "/mongo/posts/viral", {'params': {'days': 30, 'min_likes': 10, 'limit': 20}})]
+    if name == 'posts_by_date':
+        end = datetime.now()
+        start = end - timedelta(days=rng.choice((7, 30, 365)))
+        params = {'user_id': user_id, 'start_date': start.isoformat(), 'end_date': end.isoformat(), 'limit': 20}
+        return [('GET', "/mongo/posts/date-range", {'params': params})]
+    if name == 'summary':
+        return [('GET', f"/mongo/users/{user_id}/summary", {})]
+    if name == 'best_friends':
+        return [('GET', f"/mongo/users/{user_id}/best-friends", {'params': {'limit': 20}})]
+    if name == 'saved_posts':
+        return [('GET', f"/mongo/users/{user_id}/saved-posts", {'params': {'limit': 20}})]
+    if name == 'following':
+        return [('GET', f"/mongo/users/{user_id}/following", {'params': {'limit': 50}})]
+    if name == 'search_history':
+        return [('GET', f"/mongo/users/{user_id}/search-history", {})]
+    if name == 'follow_unfollow':
+        other_id = rng.choice([candidate for candidate in targets['user_ids'] if candidate != user_id])
+        return [
+            ('POST', f"/mongo/users/{user_id}/following", {'json': {'following_id': other_id}}),
+            ('DELETE', f"/mongo/users/{user_id}/following", {'params': {'following_id': other_id}}),
+        ]
+    if name == 'save_unsave':
+        if not targets['post_ids']:
+            return []
+        post_id = rng.choice(targets['post_ids'])
+        return [
+            ('POST', f"/mongo/users/{user_id}/saved-posts", {'json': {'post_id': post_id}}),
+            ('DELETE', f"/mongo/users/{user_id}/saved-posts", {'params': {'post_id': post_id}}),
+        ]
+    raise ValueError(f"Unknown scenario {name}")
+
+
+def load_worker(base_url, targets, mix, deadline, warmup_until, seed, results, timeout):
+    rng = random.Random(seed)
+    session = new_session()
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in names]
+    # route -> [latencias en segundos], route -> {status: conteo}
+    latencies = {}
+    statuses = {}
+
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+
+        name = rng.choices(names, weights)[0]
+        for method, path, kwargs in build_request(name, targets, rng):
+            route = f"{name}:{method}" if name in ('follow_unfollow', 'save_unsave') else name
+            started = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, timeout=timeout, **kwargs)
+                # Se consume el cuerpo para medir la respuesta completa
+                response.content
+                status = response.status_code
+            except requests.exceptions.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+
+            # Las requests del calentamiento no se cuentan
+            if started >= warmup_until:
+                latencies.setdefault(route, []).append(elapsed)
+                route_statuses = statuses.setdefault(route, {})
+                route_statuses[status] = route_statuses.get(status, 0) + 1
+
+            # Un 409 es un follow o guardado que ya existia en el dataset: el escenario solo
+            # deshace lo que creo, para no borrar datos reales
+            if method == 'POST' and status != 201:
+                break
+
+    session.close()
+    results.append((latencies, statuses))
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank sobre valores ya ordenados
+    if not sorted_values:
+        return 0
+    rank = max(1, -(-p * len(sorted_values) // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def is_error(status):
+    # 409 es la respuesta esperada de una escritura idempotente repetida
+    return not isinstance(status, int) or (status >= 400 and status != 409)
+
+
+def summarize_load(results, measured_seconds):
+    latencies = {}
+    statuses = {}
+    for worker_latencies, worker_statuses in results:
+        for route, values in worker_latencies.items():
+            latencies.setdefault(route, []).extend(values)
+        for route, counts in worker_statuses.items():
+            merged = statuses.setdefault(route, {})
+            for status, count in counts.items():
+                merged[status] = merged.get(status, 0) + count
+
+    routes = {}
+    for route in sorted(latencies):
+        values = sorted(latencies[route])
+        errors = sum(count for status, count in statuses[route].items() if is_error(status))
+        routes[route] = {
+            'requests': len(values),
+            'errors': errors,
+            'throughput_rps': round(len(values) / measured_seconds, 2),
+            'mean_ms': round(sum(values) / len(values) * 1000, 3),
+            **{f"p{p}_ms": round(percentile(values, p) * 1000, 3) for p in LOAD_PERCENTILES},
+            'max_ms': round(values[-1] * 1000, 3),
+            'status_codes': {str(status): count for status, count in sorted(statuses[route].items(), key=str)},
+        }
+
+    all_values = sorted(value for values in latencies.values() for value in values)
+    total = len(all_values)
+    return {
+        'requests': total,
+        'errors': sum(route['errors'] for route in routes.values()),
+        'throughput_rps': round(total / measured_seconds, 2),
+        **{f"p{p}_ms": round(percentile(all_values, p) * 1000, 3) for p in LOAD_PERCENTILES},
+        'routes': routes,
+    }
+
+
+def print_load_report(report, baseline=None):
+    header = f"{'route':<24}{'req':>8}{'err':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    if baseline:
+        header += f"{'p50 vs base':>13}{'p99 vs base':>13}"
+    print(header)
+    print("-" * len(header))
+
+    baseline_routes = (baseline or {}).get('summary', {}).get('routes', {})
+    rows = list(report['routes'].items()) + [('TOTAL', report)]
+    for route, stats in rows:
+        line = (
+            f"{route:<24}{stats['requests']:>8}{stats['errors']:>6}{stats['throughput_rps']:>9.1f}"
+            f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+        )
+        if baseline:
+            base = baseline['summary'] if route == 'TOTAL' else baseline_routes.get(route)
+            for key in ('p50_ms', 'p99_ms'):
+                if base and base.get(key):
+                    line += f"{(stats[key] / base[key] - 1) * 100:>+12.1f}%"
+                else:
+                    line += f"{'n/a':>13}"
+        print(line)
+
+
+def run_load(args):
+    base_url = args.url.rstrip('/')
+    mix = parse_mix(args.mix)
+    targets = discover_targets(base_url, args.locations.split(','), args.sample_users)
+    print(
+        f"Load test against {base_url}: {args.concurrency} threads, {args.duration}s "
+        f"(+{args.warmup}s warmup), {len(targets['user_ids'])} users, {len(targets['post_ids'])} posts"
+    )
+
+    started_at = datetime.now()
+    start = time.perf_counter()
+    warmup_until = start + args.warmup
+    deadline = warmup_until + args.duration
+    results = []
+    threads = [
+        threading.Thread(
+            target=load_worker,
+            args=(base_url, targets, mix, deadline, warmup_until, args.seed + i, results, args.timeout),
+            daemon=True
+        )
+        for i in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Tiempo medido real: desde el fin del calentamiento hasta que termina el ultimo thread
+    measured_seconds = max(time.perf_counter() - warmup_until, 1e-9)
+    report = {
+        'started_at': started_at.isoformat(),
+        'config': {
+            'url': base_url,
+            'concurrency': args.concurrency,
+            'duration_seconds': args.duration,
+            'warmup_seconds': args.warmup,
+            'mix': mix,
+            'seed': args.seed,
+        },
+        'measured_seconds': round(measured_seconds, 3),
+        'summary': summarize_load(results, measured_seconds),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print_load_report(report['summary'], baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Project-BDNR client; interactive menu by default")
+    parser.add_argument('--load', action='store_true', help='run the non-interactive load test')
+    parser.add_argument('--url', default=API_BASE_URL)
+    parser.add_argument('--concurrency', type=int, default=16, help='threads, each with its own keep-alive session')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds not counted at the start')
+    parser.add_argument(
+        '--mix',
+        help=f"scenario weights, e.g. user=20,viral=5,follow_unfollow=2 (scenarios: {', '.join(LOAD_SCENARIOS)})"
+    )
+    parser.add_argument('--locations', default='Jalisco', help='comma separated locations used to discover users')
+    parser.add_argument('--sample-users', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--compare', help='previous JSON report to compare p50/p99 against')
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    if args.load:
+        run_load(args)
+    else:
+        main()
\ No newline at end of file
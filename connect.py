@@ -1,18 +1,162 @@
-
+import os
+import threading
+import time
 from pymongo import MongoClient
-from cassandra.cluster import Cluster
-import pydgraph
+from pymongo import monitoring
+from MongoDB.instrumentation import command_listener
+
+# Backends habilitados, ej. BDNR_BACKENDS=mongo,cassandra,dgraph. Los drivers de
+# Cassandra y Dgraph solo se importan si su backend esta habilitado.
+ENABLED_BACKENDS = {
+    name.strip().lower()
+    for name in os.getenv('BDNR_BACKENDS', 'mongo').split(',')
+    if name.strip()
+}
+
+def backend_enabled(name):
+    return name in ENABLED_BACKENDS
+
+def _require_backend(name):
+    if not backend_enabled(name):
+        raise RuntimeError(f"{name} backend is disabled, add it to BDNR_BACKENDS")
+
+def _env_int(name, default=None):
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
 
 # MONGODB
+# None deja el default del driver
+MONGO_POOL_CONFIG = {
+    'maxPoolSize': _env_int('MONGO_MAX_POOL_SIZE', 100),
+    'minPoolSize': _env_int('MONGO_MIN_POOL_SIZE', 0),
+    'maxIdleTimeMS': _env_int('MONGO_MAX_IDLE_TIME_MS'),
+    'maxConnecting': _env_int('MONGO_MAX_CONNECTING', 2),
+    'waitQueueTimeoutMS': _env_int('MONGO_WAIT_QUEUE_TIMEOUT_MS'),
+    'connectTimeoutMS': _env_int('MONGO_CONNECT_TIMEOUT_MS', 20000),
+    'serverSelectionTimeoutMS': _env_int('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000),
+    'socketTimeoutMS': _env_int('MONGO_SOCKET_TIMEOUT_MS'),
+}
+
+
+class MongoPoolStats(monitoring.ConnectionPoolListener):
+    """Cuenta conexiones creadas, en uso y el tiempo de espera para obtener una del pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checkout_started = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.created = 0
+            self.closed = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.checkout_timeouts = 0
+            self.wait_time_total = 0.0
+            self.wait_time_max = 0.0
+            self.pool_clears = 0
+
+    def _wait_time(self):
+        started = getattr(self._checkout_started, 'value', None)
+        self._checkout_started.value = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def connection_check_out_started(self, event):
+        # El check out empieza y termina en el mismo thread
+        self._checkout_started.value = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = self._wait_time()
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def connection_check_out_failed(self, event):
+        waited = self._wait_time()
+        with self._lock:
+            self.checkout_failures += 1
+            self.checkout_timeouts += event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            attempts = self.checkouts + self.checkout_failures
+            return {
+                'connections_created': self.created,
+                'connections_closed': self.closed,
+                'connections_open': self.created - self.closed,
+                'checked_out': self.checked_out,
+                'max_checked_out': self.max_checked_out,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'checkout_timeouts': self.checkout_timeouts,
+                'wait_time_avg_ms': round(self.wait_time_total / attempts * 1000, 3) if attempts else 0,
+                'wait_time_max_ms': round(self.wait_time_max * 1000, 3),
+                'pool_clears': self.pool_clears
+            }
+
+
+mongo_pool_stats = MongoPoolStats()
+
 _mongo_client = None
 _mongo_db = None
 
+# Varios threads del executor pueden pedir la conexion al mismo tiempo en el primer uso;
+# sin lock cada uno crearia su propio cliente (con su pool y threads de monitoreo)
+_connect_lock = threading.Lock()
+
 def get_mongo_db():
     global _mongo_client, _mongo_db
     
     if _mongo_db is None:
-        _mongo_client = MongoClient('localhost', 27017)
-        _mongo_db = _mongo_client['social_network']
+        with _connect_lock:
+            if _mongo_db is None:
+                _require_backend('mongo')
+                options = {key: value for key, value in MONGO_POOL_CONFIG.items() if value is not None}
+                # connect=False: la conexion se abre en la primera operacion, no al importar
+                _mongo_client = MongoClient(
+                    os.getenv('MONGO_HOST', 'localhost'),
+                    _env_int('MONGO_PORT', 27017),
+                    connect=False,
+                    event_listeners=[mongo_pool_stats, command_listener],
+                    **options
+                )
+                _mongo_db = _mongo_client['social_network']
     
     return _mongo_db
 
@@ -22,6 +166,16 @@ def get_mongo_collection(collection_name):
     return db[collection_name]
 
 
+class LazyMongoDatabase:
+    """Resuelve la base en cada acceso, asi cada proceso (worker) usa su propio cliente."""
+
+    def __getattr__(self, name):
+        return getattr(get_mongo_db(), name)
+
+    def __getitem__(self, name):
+        return get_mongo_db()[name]
+
+
 # CASSANDRA
 _cassandra_session = None
 
@@ -29,18 +183,30 @@ def get_cassandra_session():
     global _cassandra_session
     
     if _cassandra_session is None:
-        cluster = Cluster(['localhost'], port=9042)
-        _cassandra_session = cluster.connect()
-        
-        # Crear keyspace si no existe
-        _cassandra_session.execute("""
-            CREATE KEYSPACE IF NOT EXISTS social_network
-            WITH replication = {
-                'class': 'SimpleStrategy',
-                'replication_factor': 1
-            }
-        """)
-        _cassandra_session.set_keyspace('social_network')
+        with _connect_lock:
+            if _cassandra_session is None:
+                _require_backend('cassandra')
+                from cassandra.cluster import Cluster
+
+                cluster = Cluster(
+                    os.getenv('CASSANDRA_HOSTS', 'localhost').split(','),
+                    port=_env_int('CASSANDRA_PORT', 9042),
+                    connect_timeout=_env_int('CASSANDRA_CONNECT_TIMEOUT', 5),
+                    executor_threads=_env_int('CASSANDRA_EXECUTOR_THREADS', 2)
+                )
+                session = cluster.connect()
+
+                # Crear keyspace si no existe
+                session.execute("""
+                    CREATE KEYSPACE IF NOT EXISTS social_network
+                    WITH replication = {
+                        'class': 'SimpleStrategy',
+                        'replication_factor': 1
+                    }
+                """)
+                session.set_keyspace('social_network')
+                # Se publica ya con el keyspace: los demas threads no ven una sesion a medias
+                _cassandra_session = session
     
     return _cassandra_session
 
@@ -52,8 +218,13 @@ def get_dgraph_client():
     global _dgraph_client
     
     if _dgraph_client is None:
-        stub = pydgraph.DgraphClientStub('localhost:9080')
-        _dgraph_client = pydgraph.DgraphClient(stub)
+        with _connect_lock:
+            if _dgraph_client is None:
+                _require_backend('dgraph')
+                import pydgraph
+
+                stub = pydgraph.DgraphClientStub(os.getenv('DGRAPH_ADDRESS', 'localhost:9080'))
+                _dgraph_client = pydgraph.DgraphClient(stub)
     
     return _dgraph_client
 
@@ -61,17 +232,60 @@ def get_dgraph_client():
 def close_all_connections():
     global _mongo_client, _mongo_db, _cassandra_session, _dgraph_client
     
-    if _mongo_client:
-        _mongo_client.close()
-        _mongo_client = None
-        _mongo_db = None
-    
-    if _cassandra_session:
-        _cassandra_session.shutdown()
-        _cassandra_session = None
-    
-    if _dgraph_client:
-        _dgraph_client = None
+    with _connect_lock:
+        if _mongo_client:
+            _mongo_client.close()
+            _mongo_client = None
+            _mongo_db = None
+        
+        if _cassandra_session:
+            _cassandra_session.shutdown()
+            _cassandra_session = None
+        
+        if _dgraph_client:
+            _dgraph_client = None
+
+def get_pool_stats():
+    stats = {}
+
+    if backend_enabled('mongo'):
+        stats['mongo'] = {
+            'config': MONGO_POOL_CONFIG,
+            'connected': _mongo_client is not None,
+            **mongo_pool_stats.snapshot()
+        }
+
+    if backend_enabled('cassandra'):
+        stats['cassandra'] = {
+            'connected': _cassandra_session is not None,
+            # open_count e in_flights por host
+            'hosts': {
+                str(host): state for host, state in _cassandra_session.get_pool_state().items()
+            } if _cassandra_session else {}
+        }
+
+    if backend_enabled('dgraph'):
+        stats['dgraph'] = {
+            'connected': _dgraph_client is not None,
+            'address': os.getenv('DGRAPH_ADDRESS', 'localhost:9080')
+        }
+
+    return stats
+
+# Los clientes no son fork-safe: el proceso hijo olvida los del padre (sin cerrarlos,
+# siguen siendo del padre) y crea los suyos en el primer uso.
+def _forget_connections_after_fork():
+    global _mongo_client, _mongo_db, _cassandra_session, _dgraph_client, _connect_lock
+
+    _mongo_client = None
+    _mongo_db = None
+    _cassandra_session = None
+    _dgraph_client = None
+    # El lock pudo quedar tomado por un thread del padre que no existe en el hijo
+    _connect_lock = threading.Lock()
+    mongo_pool_stats.reset()
+
+os.register_at_fork(after_in_child=_forget_connections_after_fork)
 
 def test_connections():
     print("\nCONNECTIONS:")
@@ -79,40 +293,43 @@ def test_connections():
     results = {}
     
     # MongoDB
-    try:
-        db = get_mongo_db()
-        db.list_collection_names()
-        print("MongoDB connected\n")
-        results['MongoDB'] = True
-
-    except Exception as e:
-        print(f"MongoDB failed: {e}\n")
-        results['MongoDB'] = False
+    if backend_enabled('mongo'):
+        try:
+            db = get_mongo_db()
+            db.list_collection_names()
+            print("MongoDB connected\n")
+            results['MongoDB'] = True
+
+        except Exception as e:
+            print(f"MongoDB failed: {e}\n")
+            results['MongoDB'] = False
     
     # Cassandra
-    try:
-        session = get_cassandra_session()
-        session.execute("SELECT now() FROM system.local")
-        print("Cassandra connected\n")
-        results['Cassandra'] = True
-
-    except Exception as e:
-        print(f"Cassandra filed: {e}\n")
-        results['Cassandra'] = False
+    if backend_enabled('cassandra'):
+        try:
+            session = get_cassandra_session()
+            session.execute("SELECT now() FROM system.local")
+            print("Cassandra connected\n")
+            results['Cassandra'] = True
+
+        except Exception as e:
+            print(f"Cassandra filed: {e}\n")
+            results['Cassandra'] = False
     
     # Dgraph
-    try:
-        client = get_dgraph_client()
-        query = "schema {}"
-        txn = client.txn(read_only=True)
-        txn.query(query)
-        txn.discard()
-        print("Dgraph connected\n")
-        results['Dgraph'] = True
-
-    except Exception as e:
-        print(f"Dgraph failed: {e}\n")
-        results['Dgraph'] = False
+    if backend_enabled('dgraph'):
+        try:
+            client = get_dgraph_client()
+            query = "schema {}"
+            txn = client.txn(read_only=True)
+            txn.query(query)
+            txn.discard()
+            print("Dgraph connected\n")
+            results['Dgraph'] = True
+
+        except Exception as e:
+            print(f"Dgraph failed: {e}\n")
+            results['Dgraph'] = False
     
     return all(results.values())
 
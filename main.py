@@ -1,17 +1,35 @@
+import time
+_startup_started = time.perf_counter()
+
+import asyncio
 import falcon.asgi
 import logging
-from connect import get_mongo_db, get_cassandra_session, get_dgraph_client, test_connections
-from MongoDB import resources
+import os
+from connect import ENABLED_BACKENDS, LazyMongoDatabase, close_all_connections, get_pool_stats
+from MongoDB import async_queries, queries, resources
+from MongoDB.instrumentation import profiler
+from MongoDB.json_handler import create_json_handler
+import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class LoggingMiddleware:
-    async def process_request(self, req, resp):
-        logger.info(f"Request: {req.method} {req.uri}")
-
     async def process_response(self, req, resp, resource, req_succeeded):
-        logger.info(f"Response: {resp.status} for {req.method} {req.uri}")
+        # Una sola linea por request; el formato solo se arma si el nivel esta habilitado
+        if logger.isEnabledFor(logging.INFO):
+            started = req.context.get('metrics_started')
+            elapsed_ms = (time.perf_counter() - started) * 1000 if started is not None else 0
+            logger.info("%s %s -> %s (%.1f ms)", req.method, req.uri, resp.status, elapsed_ms)
+
+class LifecycleMiddleware:
+    async def process_shutdown(self, scope, event):
+        logger.info(f"Worker {os.getpid()} shutting down")
+        # Termina las queries en curso antes de cerrar los clientes; ambas esperas bloquean,
+        # asi que corren fuera del event loop
+        await asyncio.to_thread(async_queries.shutdown_executor, wait=True)
+        await asyncio.to_thread(profiler.shutdown_explain, wait=True)
+        await asyncio.to_thread(close_all_connections)
 
 class HealthCheckResource:
     async def on_get(self, req, resp):
@@ -22,97 +40,49 @@ class HealthCheckResource:
         }
         resp.status = falcon.HTTP_200
 
-app = falcon.asgi.App(middleware=[LoggingMiddleware()])
-
-logger.info("Connecting Databases")
-try:
-    test_connections()
-    logger.info("Databases connected correclty")
-except Exception as e:
-    logger.error(f"Failed connections: {e}")
-    raise
-
-mongo_db = get_mongo_db()
-logger.info("MongoDB connected")
-
-#verificando indices
-logger.info("Cheking Index creation")
-try:
-    # Indexes Users
-    mongo_db.users.create_index([("username", 1)], unique=True, background=True, name="username_unique")
-    mongo_db.users.create_index([("email", 1)], unique=True, background=True, name="email_unique")
-    mongo_db.users.create_index([("personal_info.location", 1)], background=True, name="location_search")
-
-    # Indexes Post
-    mongo_db.posts.create_index([("hashtags", 1)], background=True, name="hashtags_search")
-    mongo_db.posts.create_index([("is_viral", 1)], background=True, name="is_viral_filter")
-    mongo_db.posts.create_index([("location", 1)], background=True, name="location_filter")
-    mongo_db.posts.create_index([("likes_count", 1)], background=True, name="likes_count_sort")
-
-    # Indexes User_relationships
-    mongo_db.user_relationships.create_index([("following_id", 1)], background=True, name="following_lookup")
-    mongo_db.user_relationships.create_index([("follower_id", 1)], background=True, name="follower_lookup")
-    mongo_db.user_relationships.create_index(
-        [("follower_id", 1), ("following_id", 1)], 
-        unique=True, 
-        background=True,
-        name="unique_relationship"
-    )
+class PoolStatsResource:
+    async def on_get(self, req, resp):
+        # Estadisticas del proceso (worker) que atiende el request
+        resp.media = {
+            'pid': os.getpid(),
+            'pools': get_pool_stats()
+        }
+        resp.status = falcon.HTTP_200
 
-    # Indexes Best_friends
-    mongo_db.best_friends.create_index(
-        [("user_id", 1), ("friend_id", 1)],
-        background=True,
-        name="search_friend"
-    )
-    mongo_db.best_friends.create_index(
-        [("user_id", 1), ("friend_id", 1)],
-        unique=True,
-        background=True,
-        name="unique_friendship"
-    )
+# MetricsMiddleware va primero para que su tiempo incluya al resto de los middlewares
+app = falcon.asgi.App(middleware=[metrics.MetricsMiddleware(), LifecycleMiddleware(), LoggingMiddleware()])
 
-    # Indexes Saved_posts
-    mongo_db.saved_posts.create_index(
-        [("user_id", 1), ("saved_at", -1)],
-        background=True,
-        name="show_saved"
-    )
-    mongo_db.saved_posts.create_index(
-        [("user_id", 1), ("post_id", 1)],
-        unique=True,
-        background=True,
-        name="unique_saved_post"
-    )
+# ObjectId y datetime se serializan directo a bytes en una sola pasada
+json_handler = create_json_handler()
+app.req_options.media_handlers[falcon.MEDIA_JSON] = json_handler
+app.resp_options.media_handlers[falcon.MEDIA_JSON] = json_handler
 
-    # Indexes search_history
-    mongo_db.search_history.create_index(
-        [("user_id", 1), ("searched_at", -1)],
-        background=True,
-        name="show_recent"
-    )
-    mongo_db.search_history.create_index(
-        [("searched_at", 1)],
-        expireAfterSeconds=7776000,  # 90 días
-        background=True,
-        name="delete_after_90_days"
-    )
-    logger.info("Indexes created correclty")
-except Exception as e:
-    logger.warning(f"Failed verifying indexes")
+# Cada worker crea su cliente de MongoDB en el primer request (tambien despues de un fork).
+# python3 connect.py sigue sirviendo para probar las conexiones de los backends habilitados.
+logger.info(f"Enabled backends: {', '.join(sorted(ENABLED_BACKENDS))}")
+mongo_db = LazyMongoDatabase()
+
+# Los indices se administran con migrate.py, ya no se crean al importar la app
 
 # Health check
 health_check = HealthCheckResource()
+pool_stats = PoolStatsResource()
+metrics_resource = metrics.MetricsResource()
+metrics.registry.collectors.append(metrics.pool_collector(get_pool_stats))
+metrics.registry.collectors.append(metrics.cache_collector('users', queries.user_cache))
+metrics.registry.collectors.append(metrics.query_collector(profiler))
 
 # Usuarios
 user_resource = resources.UserResource(mongo_db)
 users_resource = resources.UsersResource(mongo_db)
 users_by_location = resources.UsersByLocationResource(mongo_db)
+users_batch = resources.UsersBatchResource(mongo_db)
 
 # Posts
 posts_by_date = resources.PostsByDateRangeResource(mongo_db)
 viral_posts = resources.ViralPostsResource(mongo_db)
 posts_resource = resources.PostsResource(mongo_db)
+post_engagement = resources.PostEngagementResource(mongo_db)
 
 # Seguimiento
 user_following = resources.UserFollowingResource(mongo_db)
@@ -125,14 +95,21 @@ notification_preferences = resources.NotificationPreferencesResource(mongo_db)
 search_history = resources.SearchHistoryResource(mongo_db)
 best_friends = resources.BestFriendsResource(mongo_db)
 saved_posts = resources.SavedPostsResource(mongo_db)
+best_friends_bulk = resources.BestFriendsBulkResource(mongo_db)
+saved_posts_bulk = resources.SavedPostsBulkResource(mongo_db)
 profile_summary = resources.ProfileSummaryResource(mongo_db)
+cache_stats = resources.CacheStatsResource()
+query_profiler = resources.QueryProfilerResource(mongo_db)
 
 app.add_route('/health', health_check)
+app.add_route('/health/pools', pool_stats)
+app.add_route('/metrics', metrics_resource)                          # Prometheus, por worker
 
 #User
 app.add_route('/mongo/users', users_resource)                       
 app.add_route('/mongo/users/{user_id}', user_resource)                 
 app.add_route('/mongo/users/location', users_by_location) 
+app.add_route('/mongo/users/batch', users_batch)                   # GET ?ids= / ?usernames=, POST
 app.add_route('/mongo/users/{user_id}/privacy', privacy_settings)   
 app.add_route('/mongo/users/{user_id}/notifications', notification_preferences)  
 
@@ -140,22 +117,53 @@ app.add_route('/mongo/users/{user_id}/notifications', notification_preferences)
 app.add_route('/mongo/posts', posts_resource)                          
 app.add_route('/mongo/posts/date-range', posts_by_date)                
 app.add_route('/mongo/posts/viral', viral_posts)   
+app.add_route('/mongo/posts/{post_id}/engagement', post_engagement)        # POST
 
 # relationships
-app.add_route('/mongo/users/{user_id}/following', user_following) 
+app.add_route('/mongo/users/{user_id}/following', user_following)          # GET, POST, DELETE
 app.add_route('/mongo/users/{user_id}/search-history', search_history)     # GET, POST
 app.add_route('/mongo/users/{user_id}/best-friends', best_friends)         # GET, POST, DELETE
 app.add_route('/mongo/users/{user_id}/saved-posts', saved_posts)           # GET, POST, DELETE
+app.add_route('/mongo/users/{user_id}/best-friends/bulk', best_friends_bulk)   # POST, DELETE (JSON array / NDJSON)
+app.add_route('/mongo/users/{user_id}/saved-posts/bulk', saved_posts_bulk)     # POST, DELETE (JSON array / NDJSON)
 app.add_route('/mongo/users/{user_id}/summary', profile_summary)   
+app.add_route('/mongo/cache/stats', cache_stats)
+app.add_route('/mongo/admin/query-profiler', query_profiler)    # GET, PUT {enabled, slow_ms, explain}, DELETE
 
-logger.info("Routes complete")
+logger.info(f"Routes complete, startup took {(time.perf_counter() - _startup_started) * 1000:.1f} ms")
 
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="Project-BDNR API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers",
+        default=os.getenv("WEB_CONCURRENCY", "0"),
+        help="0 = desarrollo (1 proceso con reload), N = produccion con N procesos, auto = un proceso por core"
+    )
+    args = parser.parse_args()
+
+    workers = os.cpu_count() if args.workers == "auto" else int(args.workers)
+
+    if workers <= 0:
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            reload=True,
+            log_level="info"
+        )
+    else:
+        # Cada worker importa main:app por su cuenta y crea sus propios clientes
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            workers=workers,
+            log_level="warning",
+            access_log=False,
+            timeout_graceful_shutdown=30
+        )
\ No newline at end of file
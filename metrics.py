@@ -0,0 +1,239 @@
+import time
+from bisect import bisect_left
+
+import falcon
+
+# Limites de los buckets (le = "menor o igual"), el bucket +Inf es implicito
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Los requests que no coinciden con ninguna ruta se agrupan para no crear una serie por URL
+UNMATCHED_ROUTE = 'unmatched'
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Histograma acumulativo por combinacion de etiquetas.
+
+    Las metricas viven en el event loop del worker, asi que no necesitan lock;
+    cada worker expone sus propios valores.
+    """
+
+    def __init__(self, name, description, label_names, buckets):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            # [conteo por bucket..., +Inf, suma]
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.description}")
+        lines.append(f"# TYPE {self.name} histogram")
+
+        for labels, series in sorted(self._series.items()):
+            label_text = _format_labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            cumulative += series[-2]
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+
+
+class Gauge:
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values = {}
+
+    def inc(self, labels=(), amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels=(), amount=1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.description}")
+        lines.append(f"# TYPE {self.name} gauge")
+
+        for labels, value in sorted(self._values.items()):
+            if self.label_names:
+                lines.append(f"{self.name}{{{_format_labels(self.label_names, labels)}}} {value}")
+            else:
+                lines.append(f"{self.name} {value}")
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _render_value(lines, name, metric_type, description, samples):
+    """samples: lista de (etiquetas como dict, valor)."""
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} {metric_type}")
+    for labels, value in samples:
+        if labels:
+            lines.append(f"{name}{{{_format_labels(labels.keys(), labels.values())}}} {value}")
+        else:
+            lines.append(f"{name} {value}")
+
+
+class MetricsRegistry:
+    def __init__(self):
+        labels = ('method', 'route', 'status')
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Request latency including body serialization.',
+            labels, LATENCY_BUCKETS
+        )
+        self.request_size = Histogram(
+            'http_request_size_bytes', 'Request body size (Content-Length).', labels, SIZE_BUCKETS
+        )
+        self.response_size = Histogram(
+            'http_response_size_bytes', 'Response body size.', labels, SIZE_BUCKETS
+        )
+        self.in_flight = Gauge('http_requests_in_flight', 'Requests currently being served.')
+        self.in_flight_by_route = Gauge(
+            'http_route_requests_in_flight', 'Requests currently being served per route.', ('method', 'route')
+        )
+        # Funciones que agregan metricas externas (pools, cache) al momento de exportar
+        self.collectors = []
+
+    def render(self):
+        lines = []
+        self.in_flight.render(lines)
+        self.in_flight_by_route.render(lines)
+        self.request_duration.render(lines)
+        self.request_size.render(lines)
+        self.response_size.render(lines)
+        for collector in self.collectors:
+            collector(lines)
+        lines.append('')
+        return '\n'.join(lines)
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """Latencia, tamanos y requests en curso por metodo, ruta (plantilla) y status."""
+
+    def __init__(self, metrics=registry):
+        self.metrics = metrics
+
+    async def process_request(self, req, resp):
+        req.context.metrics_started = time.perf_counter()
+        req.context.metrics_route = None
+        self.metrics.in_flight.inc()
+
+    async def process_resource(self, req, resp, resource, params):
+        # Despues del ruteo ya se conoce la plantilla (/mongo/users/{user_id}), no la URL concreta
+        route = (req.method, req.uri_template or UNMATCHED_ROUTE)
+        req.context.metrics_route = route
+        self.metrics.in_flight_by_route.inc(route)
+
+    async def process_response(self, req, resp, resource, req_succeeded):
+        route = req.context.get('metrics_route')
+        if route is not None:
+            self.metrics.in_flight_by_route.dec(route)
+
+        started = req.context.get('metrics_started')
+        if started is None:
+            return
+        self.metrics.in_flight.dec()
+
+        # El cuerpo serializado se guarda en la respuesta, Falcon no lo vuelve a generar
+        body = None if resp.stream is not None else await resp.render_body()
+        elapsed = time.perf_counter() - started
+
+        labels = (req.method, req.uri_template or UNMATCHED_ROUTE, resp.status_code)
+        self.metrics.request_duration.observe(labels, elapsed)
+        self.metrics.request_size.observe(labels, req.content_length or 0)
+        if body is not None:
+            self.metrics.response_size.observe(labels, len(body))
+
+
+class MetricsResource:
+    def __init__(self, metrics=registry):
+        self.metrics = metrics
+
+    async def on_get(self, req, resp):
+        resp.content_type = PROMETHEUS_CONTENT_TYPE
+        resp.text = self.metrics.render()
+        resp.status = falcon.HTTP_200
+
+
+# Contadores que el exportador reporta como counter; el resto de los valores numericos son gauges
+_COUNTER_KEYS = {
+    'connections_created', 'connections_closed', 'checkouts', 'checkout_failures', 'checkout_timeouts',
+    'clears', 'hits', 'misses', 'evictions', 'expirations', 'invalidations',
+    'calls', 'errors', 'slow', 'total_ms', 'documents', 'commands'
+}
+
+
+def _numeric_items(stats):
+    return [
+        (key, value) for key, value in stats.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    ]
+
+
+def _render_families(lines, prefix, label_name, stats_by_label, descriptions):
+    """Agrupa {etiqueta: {stat: valor}} en una familia por stat, como pide el formato de Prometheus."""
+    families = {}
+    for label, stats in stats_by_label.items():
+        for key, value in _numeric_items(stats):
+            families.setdefault(key, []).append(({label_name: label}, value))
+
+    for key, samples in families.items():
+        metric_type = 'counter' if key in _COUNTER_KEYS else 'gauge'
+        _render_value(lines, f"{prefix}_{key}", metric_type, descriptions.format(key), samples)
+
+
+def pool_collector(get_pool_stats):
+    """Exporta get_pool_stats() como db_pool_<stat>{backend="..."}."""
+
+    def collect(lines):
+        stats = {
+            backend: {key[len('pool_'):] if key.startswith('pool_') else key: value for key, value in values.items()}
+            for backend, values in get_pool_stats().items()
+        }
+        _render_families(lines, 'db_pool', 'backend', stats, "Connection pool {}.")
+
+    return collect
+
+
+def query_collector(profiler):
+    """Exporta profiler.stats() como mongo_query_<stat>{function="..."}."""
+
+    def collect(lines):
+        _render_families(lines, 'mongo_query', 'function', profiler.stats(), "Query function {} in this worker.")
+
+    return collect
+
+
+def cache_collector(name, cache):
+    """Exporta cache.stats() como cache_<stat>{cache="..."}."""
+
+    def collect(lines):
+        for key, value in _numeric_items(cache.stats()):
+            metric_type = 'counter' if key in _COUNTER_KEYS else 'gauge'
+            _render_value(lines, f"cache_{key}", metric_type, f"Cache {key}.", [({'cache': name}, value)])
+
+    return collect
@@ -0,0 +1,40 @@
+import argparse
+from connect import get_mongo_db, close_all_connections
+from MongoDB.migrations import SCHEMA_VERSION, get_schema_version, migrate, plan_indexes
+from MongoDB.queries import recompute_user_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sincroniza indices y aplica migraciones de datos en MongoDB")
+    parser.add_argument("--dry-run", action="store_true", help="solo muestra lo que se haria")
+    parser.add_argument("--status", action="store_true", help="muestra la version y los indices pendientes")
+    parser.add_argument(
+        "--recompute-stats", action="store_true",
+        help="recalcula users.stats desde las colecciones (repara contadores en un standalone sin transacciones)"
+    )
+    args = parser.parse_args()
+
+    db = get_mongo_db()
+
+    try:
+        if args.status:
+            print(f"schema version: {get_schema_version(db)} (latest {SCHEMA_VERSION})")
+            plan = plan_indexes(db)
+            for collection_name, (to_create, to_drop) in plan.items():
+                for model in to_create:
+                    print(f"pending create {collection_name}.{model.document['name']}")
+                for name in to_drop:
+                    print(f"pending drop   {collection_name}.{name}")
+            if not plan:
+                print("indexes up to date")
+        elif args.recompute_stats:
+            recompute_user_stats(db)
+            print("users.stats recomputed")
+        else:
+            migrate(db, dry_run=args.dry_run)
+    finally:
+        close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,30 @@
-from connect import get_mongo_db, get_cassandra_session, get_dgraph_client
+from connect import backend_enabled, get_mongo_db, get_dgraph_client
+from MongoDB.queries import (
+    EMPTY_USER_STATS,
+    MAX_SEARCH_HISTORY,
+    build_location_search,
+    rebuild_viral_leaderboard,
+    recompute_user_stats
+)
+from MongoDB.migrations import SCHEMA_VERSION, set_schema_version, sync_indexes
+from MongoDB.bulk_loader import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_WRITERS,
+    BulkLoader,
+    Checkpoint,
+    print_throughput,
+    throughput_report
+)
+from bson.objectid import ObjectId
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from faker import Faker
 from datetime import datetime, timedelta
+import argparse
+import bisect
+import math
+import os
 import random
-import pydgraph
+import time
 
 fake = Faker('es_MX')
 
@@ -13,6 +35,7 @@ def generate_fake_data():
     num_users = 100
 
     for i in range(num_users):
+        location = fake.city() + ", Jalisco"
         user = {
             "id": i, 
             "username": fake.user_name() + str(i),
@@ -23,8 +46,9 @@ def generate_fake_data():
                 "last_name": fake.last_name(),
                 "birth_date": datetime.combine(fake.date_of_birth(minimum_age=18, maximum_age=60),datetime.min.time()),
                 "pronouns": random.choice(["he/him", "she/her", "they/them"]),
-                "location": fake.city() + ", Jalisco"
+                "location": location
             },
+            "location_search": build_location_search(location),
             "privacy_settings": {
                 "is_private": random.choice([True, False]),
                 "allow_story_replies": random.choice([True, False]),
@@ -37,12 +61,7 @@ def generate_fake_data():
                 "dm_notifications": random.choice([True, False]),
                 "allowed_notification_users": []
             },
-            "stats": {
-                "total_posts": 0,
-                "followers_count": 0,
-                "following_count": 0,
-                "saved_posts_count": 0
-            }
+            "stats": dict(EMPTY_USER_STATS)
         }
         users.append(user)
 
@@ -131,13 +150,22 @@ def generate_fake_data():
         searched_users = random.sample([uid for uid in range(num_users) if uid != user_id], 
                                       k=min(num_searches, num_users - 1))
         
-        for searched_user_id in searched_users:
-            search = {
-                "user_id": user_id,
+        entries = [
+            {
                 "searched_user_id": searched_user_id,
                 "searched_at": fake.date_time_between(start_date='-2m', end_date='now')
             }
-            search_history.append(search)
+            for searched_user_id in searched_users
+        ]
+        # Mas reciente primero y acotado como lo deja add_to_search_history
+        entries.sort(key=lambda e: e["searched_at"], reverse=True)
+        entries = entries[:MAX_SEARCH_HISTORY]
+
+        search_history.append({
+            "user_id": user_id,
+            "entries": entries,
+            "updated_at": entries[0]["searched_at"]
+        })
     
     return {
         'users': users,
@@ -148,139 +176,507 @@ def generate_fake_data():
         'search_history': search_history
     }
 
-def populate_mongodb(data):
+def populate_mongodb(data, batch_size=DEFAULT_BATCH_SIZE, writers=DEFAULT_WRITERS):
     db = get_mongo_db()
+    loader = BulkLoader(db, batch_size, writers)
     print("Llenando Mongo ...")
 
-    #eliminamos datos anteriores para evitar confusiones
-    db.users.delete_many({})
-    db.posts.delete_many({})
-    db.user_relationships.delete_many({})
-    db.best_friends.delete_many({})
-    db.saved_posts.delete_many({})
-    db.search_history.delete_many({})
+    #eliminamos datos anteriores (drop, los indices se crean al final)
+    loader.reset_collections(LOADED_COLLECTIONS)
+
+    #los _id se asignan antes de insertar para poder traducir las referencias
+    user_id_map = {user['id']: ObjectId() for user in data['users']}
+    post_id_map = {post['id']: ObjectId() for post in data['posts']}
 
-    #insertar usuarios
-    result = db.users.insert_many(data['users'])
-    user_object_ids = result.inserted_ids
-    user_id_map = {i: user_object_ids[i] for i in range(len(user_object_ids))}
+    #usuarios
+    users_for_mongo = []
+    for user in data['users']:
+        user_copy = user.copy()
+        user_copy['_id'] = user_id_map[user['id']]
+        del user_copy['id']
+        users_for_mongo.append(user_copy)
 
-    #insertar post
+    #post
     posts_for_mongo = []
     for post in data['posts']:
         post_copy = post.copy()
+        post_copy['_id'] = post_id_map[post['id']]
         post_copy['user_id'] = user_id_map[post['user_id']]
         post_copy['tagged_users'] = [user_id_map[uid] for uid in post['tagged_users']]
         del post_copy['id']
         posts_for_mongo.append(post_copy)
-    
-    result = db.posts.insert_many(posts_for_mongo)
-    post_object_ids = result.inserted_ids
-    post_id_map = {i: post_object_ids[i] for i in range(len(post_object_ids))}
 
-    #insertar User_relationships
+    #User_relationships
     relationships_for_mongo = []
     for rel in data['relationships']:
         rel_copy = rel.copy()
         rel_copy['follower_id'] = user_id_map[rel['follower_id']]
         rel_copy['following_id'] = user_id_map[rel['following_id']]
         relationships_for_mongo.append(rel_copy)
-    
-    if relationships_for_mongo:
-        db.user_relationships.insert_many(relationships_for_mongo)
-    
-    #insertar mejores amigos
+
+    #mejores amigos
     best_friends_for_mongo = []
     for bf in data['best_friends']:
         bf_copy = bf.copy()
         bf_copy['user_id'] = user_id_map[bf['user_id']]
         bf_copy['friend_id'] = user_id_map[bf['friend_id']]
         best_friends_for_mongo.append(bf_copy)
-    
-    if best_friends_for_mongo:
-        db.best_friends.insert_many(best_friends_for_mongo)
-    
-    #insertar saved_post
+
+    #saved_post
     saved_posts_for_mongo = []
     for saved in data['saved_posts']:
         saved_copy = saved.copy()
         saved_copy['user_id'] = user_id_map[saved['user_id']]
         saved_copy['post_id'] = post_id_map[saved['post_id']]
         saved_posts_for_mongo.append(saved_copy)
-    
-    if saved_posts_for_mongo:
-        db.saved_posts.insert_many(saved_posts_for_mongo)
-    
-    #insertar historial de busqueda
+
+    #historial de busqueda
     search_history_for_mongo = []
     for search in data['search_history']:
-        search_copy = search.copy()
-        search_copy['user_id'] = user_id_map[search['user_id']]
-        search_copy['searched_user_id'] = user_id_map[search['searched_user_id']]
-        search_history_for_mongo.append(search_copy)
-    
-    if search_history_for_mongo:
-        db.search_history.insert_many(search_history_for_mongo)
+        search_history_for_mongo.append({
+            '_id': user_id_map[search['user_id']],
+            'entries': [
+                {
+                    'searched_user_id': user_id_map[entry['searched_user_id']],
+                    'searched_at': entry['searched_at']
+                }
+                for entry in search['entries']
+            ],
+            'updated_at': search['updated_at']
+        })
+
+    tasks = [
+        ('users',) + loader.write('users', users_for_mongo),
+        ('posts',) + loader.write('posts', posts_for_mongo),
+        ('user_relationships',) + loader.write('user_relationships', relationships_for_mongo),
+        ('best_friends',) + loader.write('best_friends', best_friends_for_mongo),
+        ('saved_posts',) + loader.write('saved_posts', saved_posts_for_mongo),
+        ('search_history',) + loader.write('search_history', search_history_for_mongo),
+    ]
+    print_throughput(tasks)
+
+    finalize_mongodb(db)
+
+    return user_id_map, post_id_map
+
+def finalize_mongodb(db):
+    #leaderboard de posts virales y contadores de users.stats
+    rebuild_viral_leaderboard(db)
+    recompute_user_stats(db)
     
-    #Creamos index
-    try:
-        db.users.create_index([("username", 1)], unique=True, name="username_unique")
-        db.users.create_index([("email", 1)], unique=True, name="email_unique")
-        db.users.create_index([("personal_info.location", 1)], name="location_search")
-
-    # Indexes Post
-        db.posts.create_index([("hashtags", 1)], name="hashtags_search")
-        db.posts.create_index([("is_viral", 1)], name="is_viral_filter")
-        db.posts.create_index([("location", 1)], name="location_filter")
-        db.posts.create_index([("likes_count", 1)], name="likes_count_sort")
-
-    # Indexes User_relationships
-        db.user_relationships.create_index([("following_id", 1)], name="following_lookup")
-        db.user_relationships.create_index([("follower_id", 1)], name="follower_lookup")
-        db.user_relationships.create_index(
-            [("follower_id", 1), ("following_id", 1)], 
-            unique=True, 
-            name="unique_relationship"
-        )
+    #Creamos index despues de la carga y marcamos la version del esquema
+    sync_indexes(db)
+    set_schema_version(db, SCHEMA_VERSION)
 
-    # Indexes Best_friends
-        db.best_friends.create_index(
-            [("user_id", 1), ("friend_id", 1)],
-            name="search_friend"
-        )
-        db.best_friends.create_index(
-            [("user_id", 1), ("friend_id", 1)],
-            unique=True,
-            name="unique_friendship"
-        )
+#modo escala: millones de documentos generados por lotes en varios procesos
+SCALE_CHUNK_USERS = 10000
+SCALE_BATCH_SIZE = 5000
+SCALE_COLLECTIONS = ('users', 'posts', 'user_relationships', 'best_friends', 'saved_posts', 'search_history')
+LOADED_COLLECTIONS = SCALE_COLLECTIONS + ('viral_leaderboard',)
 
-    # Indexes Saved_posts
-        db.saved_posts.create_index(
-            [("user_id", 1), ("saved_at", -1)],
-            name="show_saved"
-        )
-        db.saved_posts.create_index(
-            [("user_id", 1), ("post_id", 1)],
-            unique=True,
-            name="unique_saved_post"
-        )
+HASHTAGS = ["MongoDB", "Tech", "Coding", "ITESO", "Guadalajara", "Python", "Database", "NoSQL", "Design", "Art"]
+POST_LOCATIONS = ["Guadalajara", "Zapopan", "Tlaquepaque", "Tonalá"]
+SAVED_COLLECTIONS = ["Favoritos", "Leer después", "Inspiración", "Trabajo"]
 
-    # Indexes search_history
-        db.search_history.create_index(
-            [("user_id", 1), ("searched_at", -1)],
-            name="show_recent"
-        )
-        db.search_history.create_index(
-            [("searched_at", 1)],
-            expireAfterSeconds=7776000,
-            name="delete_after_90_days"
-        )    
-        print ("Indexes created correctly")
+def user_oid(user_number):
+    # _id deterministico: cualquier proceso puede referenciar a un usuario sin consultarlo
+    return ObjectId(f"01{user_number:022x}")
 
-    except Exception as e:
-        print("Indexes creation failes\n")
+def post_oid(user_number, post_number):
+    return ObjectId(f"02{user_number:014x}{post_number:08x}")
 
-    return user_id_map, post_id_map
+def owned_oid(tag, user_number, number):
+    # Documentos de un usuario (follows, amigos, guardados): reanudar un chunk no los duplica
+    return ObjectId(f"{tag:02x}{user_number:014x}{number:08x}")
+
+class UniformProfile:
+    """Misma distribucion que generate_fake_data: todo se elige uniformemente.
+
+    Los conteos por usuario salen de un Random sembrado con (seed, usuario), asi cualquier
+    proceso puede saber cuantos posts tiene otro usuario sin coordinarse.
+    """
+
+    name = 'uniform'
+
+    def __init__(self, num_users, seed, posts_per_user=5, now=None):
+        self.num_users = num_users
+        self.seed = seed
+        self.posts_per_user = posts_per_user
+        # Las fechas van hacia atras desde el inicio de la carga, asi los datos caen dentro
+        # del TTL de search_history y de las ventanas de /posts/viral
+        self.now = now or datetime.now()
+
+    def _user_rng(self, kind, user_number):
+        return random.Random(f"{self.seed}:{kind}:{user_number}")
+
+    def post_count(self, user_number):
+        return self._user_rng('posts', user_number).randint(0, 2 * self.posts_per_user)
+
+    def following_count(self, rng, user_number):
+        return rng.randint(10, 30)
+
+    def pick_user(self, rng):
+        return rng.randrange(self.num_users)
+
+    def pick_followee(self, rng, user_number):
+        return self.pick_user(rng)
+
+    def pick_author(self, rng):
+        return self.pick_user(rng)
+
+    def pick_searched(self, rng):
+        return self.pick_user(rng)
+
+    def pick_post(self, rng):
+        # Un post existente: se elige un autor con posts y uno de sus posts
+        for _ in range(100):
+            author = self.pick_author(rng)
+            count = self.post_count(author)
+            if count:
+                return post_oid(author, rng.randrange(count))
+        return None
+
+    def engagement(self, rng, author_number):
+        return rng.randint(0, 150), rng.randint(0, 80)
+
+    def timestamp(self, rng, days_back):
+        return self.now - timedelta(seconds=rng.randrange(days_back * 86400))
+
+def zipf_rank(rng, n, exponent):
+    """Rango 0..n-1 con P(r) proporcional a 1/(r+1)^exponent, por la inversa de la CDF continua (O(1))."""
+    u = rng.random()
+    if exponent == 1:
+        x = (n + 1) ** u
+    else:
+        x = (((n + 1) ** (1 - exponent) - 1) * u + 1) ** (1 / (1 - exponent))
+    return min(int(x) - 1, n - 1)
+
+def zipf_share(rank, n, exponent):
+    # Fraccion esperada de las elecciones que caen en ese rango (misma aproximacion continua)
+    if exponent == 1:
+        return math.log((rank + 2) / (rank + 1)) / math.log(n + 1)
+    return ((rank + 2) ** (1 - exponent) - (rank + 1) ** (1 - exponent)) / ((n + 1) ** (1 - exponent) - 1)
+
+class RankPermutation:
+    """Biyeccion rango <-> usuario, para que los populares no sean los primeros ids (ni el mismo chunk)."""
+
+    def __init__(self, n, rng):
+        self.n = n
+        self.multiplier = 1
+        self.offset = 0
+        if n > 1:
+            self.multiplier = rng.randrange(1, n)
+            while math.gcd(self.multiplier, n) != 1:
+                self.multiplier += 1
+            self.offset = rng.randrange(n)
+        self.inverse = pow(self.multiplier, -1, n) if n > 1 else 1
+
+    def user(self, rank):
+        return (rank * self.multiplier + self.offset) % self.n
+
+    def rank(self, user_number):
+        return ((user_number - self.offset) * self.inverse) % self.n
+
+class SkewedProfile(UniformProfile):
+    """Grafo con la asimetria de produccion: pocos usuarios concentran seguidores, posts y likes.
+
+    - Seguidores: cada follow elige al seguido con Zipf sobre un ranking de popularidad,
+      asi el numero de seguidores sigue una ley de potencia (los primeros tienen millones).
+    - Seguidos por usuario: Pareto (la mayoria sigue a pocos, algunos a miles).
+    - Autoria: posts por usuario proporcionales a Zipf sobre otro ranking de actividad.
+    - Engagement: likes con cola pesada, escalados por los seguidores esperados del autor.
+    - Tiempos: una parte de la actividad cae en rafagas alrededor de eventos.
+    Todo sale de la semilla: la misma semilla genera el mismo grafo.
+    """
+
+    name = 'skewed'
+
+    FOLLOW_EXPONENT = 1.1
+    AUTHOR_EXPONENT = 1.05
+    SEARCH_EXPONENT = 1.2
+    MIN_FOLLOWING = 10
+    FOLLOWING_ALPHA = 2.0
+    MAX_FOLLOWING = 5000
+    MAX_POSTS_PER_USER = 100000
+    ENGAGEMENT_ALPHA = 1.3
+    LIKES_PER_FOLLOWER = 0.02
+    MAX_LIKES = 10000000
+    BURSTS = 40
+    BURST_SHARE = 0.5
+    BURST_SECONDS = 3 * 3600
+
+    def __init__(self, num_users, seed, posts_per_user=5, now=None):
+        super().__init__(num_users, seed, posts_per_user, now)
+        self.popularity = RankPermutation(num_users, random.Random(f"{seed}:popularity"))
+        self.activity = RankPermutation(num_users, random.Random(f"{seed}:activity"))
+        # Seguidos promedio de la Pareto: MIN * alpha / (alpha - 1)
+        mean_following = self.MIN_FOLLOWING * self.FOLLOWING_ALPHA / (self.FOLLOWING_ALPHA - 1)
+        self.total_follows = num_users * min(mean_following, max(num_users - 1, 0))
+
+        # Eventos (segundos hacia atras desde now) con peso Zipf: pocos eventos muy grandes
+        burst_rng = random.Random(f"{seed}:bursts")
+        self.bursts = sorted(burst_rng.randrange(365 * 86400) for _ in range(self.BURSTS))
+        weights = [1 / (i + 1) for i in range(self.BURSTS)]
+        burst_rng.shuffle(weights)
+        self.burst_weights = weights
+
+    def post_count(self, user_number):
+        rank = self.activity.rank(user_number)
+        expected = self.num_users * self.posts_per_user * zipf_share(rank, self.num_users, self.AUTHOR_EXPONENT)
+        whole = int(expected)
+        # La parte fraccionaria se redondea al azar (estable por usuario)
+        if self._user_rng('posts', user_number).random() < expected - whole:
+            whole += 1
+        return min(whole, self.MAX_POSTS_PER_USER)
+
+    def following_count(self, rng, user_number):
+        count = int(self.MIN_FOLLOWING * rng.paretovariate(self.FOLLOWING_ALPHA))
+        return min(count, self.MAX_FOLLOWING, self.num_users - 1)
+
+    def pick_followee(self, rng, user_number):
+        return self.popularity.user(zipf_rank(rng, self.num_users, self.FOLLOW_EXPONENT))
+
+    def pick_author(self, rng):
+        return self.activity.user(zipf_rank(rng, self.num_users, self.AUTHOR_EXPONENT))
+
+    def pick_searched(self, rng):
+        return self.popularity.user(zipf_rank(rng, self.num_users, self.SEARCH_EXPONENT))
+
+    def expected_followers(self, user_number):
+        rank = self.popularity.rank(user_number)
+        return min(self.total_follows * zipf_share(rank, self.num_users, self.FOLLOW_EXPONENT), self.num_users - 1)
+
+    def engagement(self, rng, author_number):
+        reach = 1 + self.expected_followers(author_number) * self.LIKES_PER_FOLLOWER
+        likes = min(int((rng.paretovariate(self.ENGAGEMENT_ALPHA) - 1) * reach), self.MAX_LIKES)
+        comments = int(likes * rng.uniform(0.02, 0.2))
+        return likes, comments
+
+    def timestamp(self, rng, days_back):
+        span = days_back * 86400
+        if rng.random() < self.BURST_SHARE:
+            # Solo los eventos dentro de la ventana; la actividad sigue al evento y decae
+            available = bisect.bisect_left(self.bursts, span)
+            if available:
+                center = rng.choices(self.bursts[:available], self.burst_weights[:available])[0]
+                seconds_back = center - rng.expovariate(1 / self.BURST_SECONDS)
+                if 0 <= seconds_back < span:
+                    return self.now - timedelta(seconds=seconds_back)
+        return self.now - timedelta(seconds=rng.randrange(span))
+
+def distinct_picks(rng, count, pick, exclude):
+    # Muestreo sin reemplazo sin construir la lista de todos los usuarios (O(count), no O(n))
+    picks = set()
+    attempts = 0
+    while len(picks) < count and attempts < count * 20:
+        attempts += 1
+        value = pick(rng)
+        if value != exclude:
+            picks.add(value)
+    return picks
+
+def scale_users(fake, rng, profile, first, last):
+    for n in range(first, last):
+        location = fake.city() + ", Jalisco"
+        username = fake.user_name() + str(n)
+        yield {
+            "_id": user_oid(n),
+            "username": username,
+            "email": f"{username}@{fake.free_email_domain()}",
+            "created_at": profile.timestamp(rng, 365),
+            "personal_info": {
+                "first_name": fake.first_name(),
+                "last_name": fake.last_name(),
+                "birth_date": datetime.combine(fake.date_of_birth(minimum_age=18, maximum_age=60), datetime.min.time()),
+                "pronouns": rng.choice(["he/him", "she/her", "they/them"]),
+                "location": location
+            },
+            "location_search": build_location_search(location),
+            "privacy_settings": {
+                "is_private": rng.random() < 0.5,
+                "allow_story_replies": rng.random() < 0.5,
+                "allow_comments": rng.choice(["everyone", "followers", "none"]),
+                "blocked_users": []
+            },
+            "notification_preferences": {
+                "language": "es",
+                "allow_notifications": rng.random() < 0.5,
+                "dm_notifications": rng.random() < 0.5,
+                "allowed_notification_users": []
+            },
+            "stats": dict(EMPTY_USER_STATS)
+        }
+
+def scale_posts(fake, rng, profile, first, last):
+    # fake.text es lo mas caro de generar; cada chunk arma un banco de textos y los reutiliza
+    descriptions = [fake.text(max_nb_chars=280) for _ in range(500)]
+    for n in range(first, last):
+        for j in range(profile.post_count(n)):
+            likes, comments = profile.engagement(rng, n)
+            created_at = profile.timestamp(rng, 180)
+            post = {
+                "_id": post_oid(n, j),
+                "user_id": user_oid(n),
+                "description": rng.choice(descriptions),
+                "created_at": created_at,
+                "location": rng.choice(POST_LOCATIONS),
+                "hashtags": rng.sample(HASHTAGS, k=rng.randint(1, 4)),
+                "tagged_users": [user_oid(u) for u in distinct_picks(rng, rng.randint(0, 3), profile.pick_user, n)],
+                "likes_count": likes,
+                "comments_count": comments,
+                "is_viral": likes >= 10
+            }
+            if post["is_viral"]:
+                post["viral_detected_at"] = created_at
+            yield post
+
+def scale_relationships(fake, rng, profile, first, last):
+    for n in range(first, last):
+        followees = distinct_picks(rng, profile.following_count(rng, n), lambda r: profile.pick_followee(r, n), n)
+        for k, followed in enumerate(sorted(followees)):
+            yield {
+                "_id": owned_oid(3, n, k),
+                "follower_id": user_oid(n),
+                "following_id": user_oid(followed),
+                "followed_at": profile.timestamp(rng, 365),
+                "status": "active"
+            }
+
+def scale_best_friends(fake, rng, profile, first, last):
+    for n in range(first, last):
+        for k, friend in enumerate(sorted(distinct_picks(rng, rng.randint(5, 10), profile.pick_user, n))):
+            yield {
+                "_id": owned_oid(4, n, k),
+                "user_id": user_oid(n),
+                "friend_id": user_oid(friend),
+                "added_at": profile.timestamp(rng, 180)
+            }
+
+def scale_saved_posts(fake, rng, profile, first, last):
+    for n in range(first, last):
+        for k, post_id in enumerate(sorted(distinct_picks(rng, rng.randint(8, 20), profile.pick_post, None) - {None})):
+            yield {
+                "_id": owned_oid(5, n, k),
+                "user_id": user_oid(n),
+                "post_id": post_id,
+                "saved_at": profile.timestamp(rng, 90),
+                "collection_name": rng.choice(SAVED_COLLECTIONS)
+            }
+
+def scale_search_history(fake, rng, profile, first, last):
+    for n in range(first, last):
+        searched = distinct_picks(rng, rng.randint(8, 15), profile.pick_searched, n)
+        entries = sorted(
+            ({"searched_user_id": user_oid(u), "searched_at": profile.timestamp(rng, 60)} for u in searched),
+            key=lambda e: e["searched_at"],
+            reverse=True
+        )[:MAX_SEARCH_HISTORY]
+        if entries:
+            yield {"_id": user_oid(n), "entries": entries, "updated_at": entries[0]["searched_at"]}
+
+SCALE_GENERATORS = {
+    'users': scale_users,
+    'posts': scale_posts,
+    'user_relationships': scale_relationships,
+    'best_friends': scale_best_friends,
+    'saved_posts': scale_saved_posts,
+    'search_history': scale_search_history,
+}
+
+PROFILES = {
+    'uniform': UniformProfile,
+    'skewed': SkewedProfile,
+}
+
+def scale_chunk(collection_name, chunk, config):
+    """Documentos de un rango de usuarios de una coleccion (tambien los usa benchmarks/bench_queries.py)."""
+    # Faker y Random propios del chunk, sembrados por (seed, coleccion, chunk): el
+    # resultado no depende de que proceso tome el chunk ni en que orden
+    chunk_seed = f"{config['seed']}:{collection_name}:{chunk}"
+    chunk_fake = Faker('es_MX')
+    chunk_fake.seed_instance(chunk_seed)
+    rng = random.Random(chunk_seed)
+    profile = PROFILES[config['profile']](config['users'], config['seed'], config['posts_per_user'], config['now'])
+
+    first = chunk * config['chunk_users']
+    last = min(first + config['chunk_users'], config['users'])
+    return SCALE_GENERATORS[collection_name](chunk_fake, rng, profile, first, last)
+
+def generate_chunk(collection_name, chunk, config):
+    """Genera y escribe un rango de usuarios de una coleccion; corre en un proceso del pool."""
+    documents = scale_chunk(collection_name, chunk, config)
+    loader = BulkLoader(get_mongo_db(), config['batch_size'], config['writers'])
+    inserted, started, finished = loader.write(collection_name, documents)
+    return collection_name, chunk, inserted, started, finished
+
+def populate_mongodb_scale(num_users, seed=42, workers=None, posts_per_user=5, profile='uniform',
+                           chunk_users=SCALE_CHUNK_USERS, batch_size=DEFAULT_BATCH_SIZE, writers=2, resume=False):
+    db = get_mongo_db()
+    config = {
+        'mode': 'scale',
+        'users': num_users,
+        'seed': seed,
+        'profile': profile,
+        'posts_per_user': posts_per_user,
+        'chunk_users': chunk_users,
+        'batch_size': batch_size,
+        'writers': writers,
+    }
+    checkpoint = Checkpoint(db, config)
+    completed = checkpoint.start(resume)
+    config['now'] = checkpoint.now
+
+    if resume:
+        print(f"Reanudando carga: {len(completed)} tareas ya terminadas")
+    else:
+        print(f"Llenando Mongo en modo escala: {num_users} usuarios, perfil {profile}, semilla {seed}")
+        BulkLoader(db).reset_collections(LOADED_COLLECTIONS)
+
+    chunks = range((num_users + chunk_users - 1) // chunk_users)
+    tasks = [
+        (collection_name, chunk)
+        for chunk in chunks
+        for collection_name in SCALE_COLLECTIONS
+        if f"{collection_name}:{chunk}" not in completed
+    ]
+    started = time.perf_counter()
+
+    # Cada proceso genera y escribe sus lotes (con sus propios escritores); al proceso
+    # principal solo regresan conteos, que se guardan como checkpoint por tarea
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {
+            executor.submit(generate_chunk, collection_name, chunk, config): (collection_name, chunk)
+            for collection_name, chunk in tasks
+        }
+        failed = []
+        for done, future in enumerate(as_completed(futures), 1):
+            collection_name, chunk = futures[future]
+            try:
+                _, _, inserted, task_started, task_finished = future.result()
+            except Exception as e:
+                # Las demas tareas siguen; las fallidas se repiten con --resume
+                failed.append(f"{collection_name}:{chunk}")
+                print(f"  [{done}/{len(futures)}] {collection_name} chunk {chunk}: ERROR {e}")
+                continue
+            checkpoint.mark_done(f"{collection_name}:{chunk}", collection_name, inserted, task_started, task_finished)
+            print(f"  [{done}/{len(futures)}] {collection_name} chunk {chunk}: {inserted} docs")
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} tasks failed ({', '.join(failed[:5])}...), run again with --resume")
+
+    elapsed = time.perf_counter() - started
+    finished_tasks = [
+        (task['collection'], task['inserted'], task['started'], task['finished'])
+        for task in checkpoint.completed_tasks()
+    ]
+    total_docs = sum(task[1] for task in finished_tasks)
+    print(f"Cargados {total_docs} documentos; esta corrida tardo {elapsed:.1f} s")
+    print_throughput(finished_tasks)
+
+    # Los indices secundarios se construyen una sola vez, con las colecciones ya llenas
+    finalize_mongodb(db)
+    checkpoint.finish()
+    return throughput_report(finished_tasks)
 
 #def populate_cassandra():
 
@@ -401,12 +797,29 @@ def populate_dgraph():
 
     
 def main():
+    parser = argparse.ArgumentParser(description="Populate the databases with fake data")
+    parser.add_argument('--scale', action='store_true', help='streaming multi-process generator for large datasets')
+    parser.add_argument('--users', type=int, default=1000000, help='users in --scale mode')
+    parser.add_argument('--posts-per-user', type=int, default=5, help='average posts per user in --scale mode')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='generator processes in --scale mode')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='uniform')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='documents per insert_many')
+    parser.add_argument('--writers', type=int, help='concurrent writer threads (per process in --scale mode)')
+    parser.add_argument('--resume', action='store_true', help='continue an interrupted --scale load from its checkpoint')
+    args = parser.parse_args()
 
-    data = generate_fake_data()
-
-    populate_mongodb(data)
+    if args.scale:
+        populate_mongodb_scale(
+            args.users, args.seed, args.workers, args.posts_per_user, args.profile,
+            batch_size=args.batch_size, writers=args.writers or 2, resume=args.resume
+        )
+    else:
+        data = generate_fake_data()
+        populate_mongodb(data, args.batch_size, args.writers or DEFAULT_WRITERS)
     #populate_cassandra()
-    populate_dgraph()
+    if backend_enabled('dgraph'):
+        populate_dgraph()
 
     print("Datos completos en todas las bases de datos")
 
@@ -0,0 +1,46 @@
+import argparse
+from connect import get_mongo_db, close_all_connections
+from MongoDB.bulk_loader import DEFAULT_BATCH_SIZE, print_throughput
+from MongoDB.snapshot import DEFAULT_PART_DOCS, dump, restore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Guarda y restaura una copia de social_network para reiniciar benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    dump_parser = subparsers.add_parser("dump", help="guarda colecciones e indices en archivos BSON comprimidos")
+    dump_parser.add_argument("directory")
+    dump_parser.add_argument("--workers", type=int, default=4, help="colecciones que se leen en paralelo")
+    dump_parser.add_argument("--part-docs", type=int, default=DEFAULT_PART_DOCS, help="documentos por archivo")
+
+    restore_parser = subparsers.add_parser("restore", help="reemplaza las colecciones con las de la copia")
+    restore_parser.add_argument("directory")
+    restore_parser.add_argument("--workers", type=int, default=4, help="archivos que se cargan en paralelo")
+    restore_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="documentos por insert_many")
+    restore_parser.add_argument("--writers", type=int, default=2, help="threads escritores por archivo")
+    restore_parser.add_argument(
+        "--keep-dates", action="store_true",
+        help="no recorre las fechas a hoy (los TTL pueden borrar los documentos viejos)"
+    )
+
+    for subparser in (dump_parser, restore_parser):
+        subparser.add_argument("--collections", nargs="+", help="solo estas colecciones")
+
+    args = parser.parse_args()
+
+    db = get_mongo_db()
+
+    try:
+        if args.command == "dump":
+            tasks = dump(db, args.directory, args.collections, args.workers, args.part_docs)
+        else:
+            tasks = restore(
+                db, args.directory, args.collections, args.workers, args.batch_size, args.writers, args.keep_dates
+            )
+        print_throughput(tasks)
+    finally:
+        close_all_connections()
+
+
+if __name__ == "__main__":
+    main()